@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+# Benchmark PhotoPuzzle on synthetic images of increasing size. Each run times
+# the load, scoring and solve phases, records their peak (traced) memory, and
+# checks the placement against the known layout of the synthetic image (direct
+# and neighbor accuracy) along with its total score. From a checkout, install
+# the package first so puzzles can be imported:
+#
+# pip install -e .
+# python benchmarks/benchmark.py --sizes 10 25 50 --output results.json
+
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from puzzles.board import PlacedPiece
+from puzzles.logger import logger
+from puzzles.models import PhotoPuzzle
+from puzzles.utils import get_temporary_name, write_image, write_json
+from puzzles.version import __version__
+
+import argparse
+import os
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def make_image(cols, rows, piece_size, seed=0):
+    """
+    Make a smooth, textured RGB image of cols by rows square pieces.
+
+    A sum of random low frequency waves per channel, plus a little noise,
+    gives edges that match their true neighbors better than others without
+    making the puzzle trivial.
+    """
+    rng = np.random.default_rng(seed)
+    height, width = rows * piece_size, cols * piece_size
+    y, x = np.mgrid[0:height, 0:width] / max(height, width)
+    image = np.zeros((height, width, 3))
+    for channel in range(3):
+        for _ in range(6):
+            fx, fy = rng.uniform(0.5, 6, size=2)
+            phase = rng.uniform(0, 2 * np.pi)
+            image[:, :, channel] += np.sin(2 * np.pi * (fx * x + fy * y) + phase)
+    image += rng.normal(scale=0.3, size=image.shape)
+    image -= image.min()
+    return (255 * image / image.max()).astype(np.uint8)
+
+
+def save_image(image, image_format="png"):
+    """
+    Save a synthetic image to a temporary file that PhotoPuzzle can load.
+    """
+    filename = get_temporary_name(prefix="benchmark", ext=image_format)
+    if image_format == "npy":
+        np.save(filename, image)
+    else:
+        write_image(filename, image)
+    return filename
+
+
+class Phases:
+    """
+    Time and trace the peak memory of named phases of a run.
+    """
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name, func, *args, **kwargs):
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        self.results[name] = {"seconds": seconds, "peak_bytes": peak}
+        return result
+
+
+def run_benchmark(size, piece_size, strategy, seed, image_format, **settings):
+    """
+    Benchmark one size by size puzzle with a given solve strategy.
+    """
+    filename = save_image(make_image(size, size, piece_size, seed), image_format)
+    phases = Phases()
+    tracemalloc.start()
+    try:
+        puzzle = PhotoPuzzle(filename, min_piece_size=piece_size, **settings)
+        phases.run("load_image", puzzle.load_image, filename, mmap=puzzle.mmap)
+        phases.run("generate_pieces", puzzle.generate_pieces)
+
+        np.random.seed(seed)
+        puzzle.shuffle()
+        if puzzle.cache_policy == "dense":
+            phases.run("compute_distances", puzzle.compute_distances)
+
+        # One full scoring pass, all pieces against the first placed piece
+        puzzle.add_piece(PlacedPiece(index=0, loc=(0, 0)))
+        unused = set(range(1, puzzle.count_pieces()))
+        phases.run("make_scores", puzzle.make_scores, unused)
+
+        phases.run("solve", puzzle.solve, strategy=strategy)
+    finally:
+        tracemalloc.stop()
+        os.remove(filename)
+
+    return {
+        "size": size,
+        "pieces": puzzle.count_pieces(),
+        "piece_size": piece_size,
+        "strategy": strategy,
+        "seed": seed,
+        "settings": settings,
+        "phases": phases.results,
+        "total_seconds": sum(phase["seconds"] for phase in phases.results.values()),
+        "peak_bytes": max(phase["peak_bytes"] for phase in phases.results.values()),
+        "direct_accuracy": puzzle.direct_accuracy(),
+        "neighbor_accuracy": puzzle.neighbor_accuracy(),
+        "score": puzzle.score_board(),
+    }
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the puzzle solver.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10, 20, 40],
+        help="puzzle sizes to run, in pieces per side (e.g., 10 for 10x10)",
+    )
+    parser.add_argument("--piece-size", type=int, default=16, help="piece pixels")
+    parser.add_argument(
+        "--strategies",
+        nargs="+",
+        default=["greedy", "buddies"],
+        help="solve strategies to benchmark",
+    )
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--format", default="png", choices=["png", "npy"])
+    parser.add_argument(
+        "--cache-policy", default="dense", choices=["dense", "unbounded", "lru"]
+    )
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--top-k", type=int, help="candidate pieces per edge")
+    parser.add_argument("--output", help="write results as json to this file")
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    results = []
+    for size in args.sizes:
+        for strategy in args.strategies:
+            for seed in args.seeds:
+                result = run_benchmark(
+                    size,
+                    args.piece_size,
+                    strategy,
+                    seed,
+                    args.format,
+                    cache_policy=args.cache_policy,
+                    workers=args.workers,
+                    top_k=args.top_k,
+                )
+                logger.info(
+                    "%sx%s %-8s seed %s: %.2fs, peak %.1f MB, accuracy %.3f "
+                    "(neighbors %.3f)"
+                    % (
+                        size,
+                        size,
+                        strategy,
+                        seed,
+                        result["total_seconds"],
+                        result["peak_bytes"] / 1e6,
+                        result["direct_accuracy"],
+                        result["neighbor_accuracy"],
+                    )
+                )
+                results.append(result)
+
+    if args.output:
+        write_json(
+            {
+                "version": __version__,
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "results": results,
+            },
+            args.output,
+        )
+        logger.info("Wrote results to %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
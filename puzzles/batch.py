@@ -0,0 +1,222 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from puzzles.logger import logger
+from puzzles.utils import recursive_find, write_json
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Images that a PhotoPuzzle can be made from
+image_extensions = (".jpg", ".jpeg", ".png", ".npy")
+
+# Decoded copies of images that mmap=True writes alongside them, e.g. x.jpg.npy
+cache_extensions = tuple("%s.npy" % ext for ext in image_extensions if ext != ".npy")
+
+
+def find_images(directory, pattern=None):
+    """
+    Find puzzle images below a directory, sorted by path, leaving out the
+    decoded image caches that PhotoPuzzle(mmap=True) writes next to them.
+    """
+    return sorted(
+        filename
+        for filename in recursive_find(directory, pattern)
+        if (pattern or filename.lower().endswith(image_extensions))
+        and not filename.lower().endswith(cache_extensions)
+    )
+
+
+def limit_memory(memory_limit):
+    """
+    Cap the address space of a worker process, in bytes (Unix only).
+    """
+    if not memory_limit:
+        return
+    try:
+        import resource
+    except ImportError:
+        logger.warning("Cannot limit worker memory on this platform.")
+        return
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+
+def solve_image(image, strategy="greedy", seed=None, **settings):
+    """
+    Shuffle and solve one puzzle, returning a result dictionary.
+
+    Errors are returned in the result instead of raised, so one bad image
+    doesn't stop a batch.
+    """
+    from puzzles.models import PhotoPuzzle
+
+    result = {"image": image, "strategy": strategy, "seed": seed}
+    start = time.perf_counter()
+    try:
+        puzzle = PhotoPuzzle(image, **settings)
+        loaded = time.perf_counter()
+        if seed is not None:
+            np.random.seed(seed)
+        puzzle.shuffle()
+        puzzle.solve(strategy=strategy)
+        solved = time.perf_counter()
+    except (Exception, SystemExit) as e:
+        result["error"] = "%s: %s" % (e.__class__.__name__, e)
+        result["seconds"] = {"total": time.perf_counter() - start}
+        return result
+
+    result["pieces"] = puzzle.count_pieces()
+    result["seconds"] = {
+        "load": loaded - start,
+        "solve": solved - loaded,
+        "total": solved - start,
+    }
+
+    # How close the solve got to the original image
+    result["direct_accuracy"] = puzzle.direct_accuracy()
+    result["neighbor_accuracy"] = puzzle.neighbor_accuracy()
+    result["score"] = puzzle.score_board()
+
+    # Each location with the tile (original piece) placed there
+    result["solution"] = [
+        [x, y, int(puzzle.order[index])]
+        for (x, y), index in sorted(puzzle.covered_places.items())
+    ]
+    return result
+
+
+def solve_batch(
+    images,
+    workers=None,
+    strategy="greedy",
+    seed=None,
+    max_tasks_per_child=None,
+    memory_limit=None,
+    **settings
+):
+    """
+    Solve many puzzles across a pool of worker processes.
+
+    Each worker solves one puzzle at a time. To bound memory per worker,
+    max_tasks_per_child replaces workers after that many puzzles (Python
+    3.11 and later) and memory_limit caps each worker's address space in
+    bytes. Returns per-puzzle results (in the order of images) and a
+    summary with aggregate throughput in puzzles per minute and mean accuracy.
+    """
+    pool_args = {"max_workers": workers}
+    if memory_limit:
+        pool_args.update({"initializer": limit_memory, "initargs": (memory_limit,)})
+    if max_tasks_per_child:
+        if sys.version_info < (3, 11):
+            logger.warning("max_tasks_per_child needs Python 3.11 or later.")
+        else:
+            pool_args["max_tasks_per_child"] = max_tasks_per_child
+
+    results = [None] * len(images)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(**pool_args) as executor:
+        futures = {
+            executor.submit(solve_image, image, strategy, seed, **settings): i
+            for i, image in enumerate(images)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            results[futures[future]] = result
+            if "error" in result:
+                logger.warning("%s: %s" % (result["image"], result["error"]))
+            logger.progress(done=done, total=len(images))
+
+    seconds = time.perf_counter() - start
+    solved = [result for result in results if "error" not in result]
+    summary = {
+        "puzzles": len(images),
+        "solved": len(solved),
+        "failed": len(images) - len(solved),
+        "seconds": seconds,
+        "puzzles_per_minute": 60 * len(solved) / seconds if seconds else None,
+        "mean_solve_seconds": (
+            float(np.mean([result["seconds"]["solve"] for result in solved]))
+            if solved
+            else None
+        ),
+        "mean_direct_accuracy": (
+            float(np.mean([result["direct_accuracy"] for result in solved]))
+            if solved
+            else None
+        ),
+        "mean_neighbor_accuracy": (
+            float(np.mean([result["neighbor_accuracy"] for result in solved]))
+            if solved
+            else None
+        ),
+    }
+    return results, summary
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description="Solve all puzzle images in a directory across many workers."
+    )
+    parser.add_argument("directory", help="directory to search for images")
+    parser.add_argument(
+        "--pattern",
+        help="only solve images matching this pattern (default is any %s)"
+        % ", ".join(image_extensions),
+    )
+    parser.add_argument("--output", default="results.json", help="results json")
+    parser.add_argument("--workers", type=int, help="worker processes (all cores)")
+    parser.add_argument(
+        "--strategy", default="greedy", choices=["greedy", "buddies", "mst", "beam"]
+    )
+    parser.add_argument("--min-piece-size", type=int, default=30)
+    parser.add_argument("--seed", type=int, help="seed for shuffling each puzzle")
+    parser.add_argument("--cache-dir", help="persistent distance cache directory")
+    parser.add_argument(
+        "--max-tasks-per-child",
+        type=int,
+        help="replace a worker after solving this many puzzles",
+    )
+    parser.add_argument(
+        "--memory-limit", type=int, help="memory limit per worker, in megabytes"
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    images = find_images(args.directory, args.pattern)
+    if not images:
+        logger.exit("No images found in %s." % args.directory)
+    logger.info("Solving %s puzzles from %s" % (len(images), args.directory))
+
+    results, summary = solve_batch(
+        images,
+        workers=args.workers,
+        strategy=args.strategy,
+        seed=args.seed,
+        max_tasks_per_child=args.max_tasks_per_child,
+        memory_limit=args.memory_limit * 1024 * 1024 if args.memory_limit else None,
+        min_piece_size=args.min_piece_size,
+        cache_dir=args.cache_dir,
+    )
+    write_json({"summary": summary, "results": results}, os.path.abspath(args.output))
+    logger.info(
+        "Solved %s of %s puzzles in %.2fs (%.2f puzzles/minute)"
+        % (
+            summary["solved"],
+            summary["puzzles"],
+            summary["seconds"],
+            summary["puzzles_per_minute"] or 0,
+        )
+    )
+    logger.info("Wrote results to %s" % args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import collections
+import copy
+
+import numpy as np
+
+
+class PlacedPiece(
+    collections.namedtuple("PlacedPiece", ["index", "loc", "rotation"], defaults=(0,))
+):
+    """
+    A placed piece, an index into the puzzle array and a board location.
+
+    The location is an x,y coordinate, not pixel location but piece location.
+    The rotation is the number of clockwise quarter turns the piece is
+    placed with, so edge e of the piece faces side (e + rotation) % 4.
+    """
+
+    __slots__ = ()
+
+    def __str__(self):
+        if self.rotation:
+            return "PuzzlePiece(index=%s, loc=%s, rotation=%s)" % self
+        return "PuzzlePiece(index=%s, loc=%s)" % (self.index, self.loc)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Placement(
+    collections.namedtuple(
+        "Placement", ["piece", "score", "total", "parent", "size", "key"]
+    )
+):
+    """
+    A placed piece, linked to the placements made before it.
+
+    A search over many partial boards (see iter_beam) keeps each board as
+    the last link of a chain of placements, so the boards of every step
+    share the placements they have in common. The score of a placement is
+    its mean distance to the neighbors it touches (pairs of them), and
+    total the sum of distances between pairs of neighbors along the chain,
+    like PhotoPuzzle.score_board. size is the number of placements, and key
+    a hash of the set of placements, which is the same for chains that make
+    the same board in a different order.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def start(cls, pieces=()):
+        """
+        Start a chain, optionally from pieces already placed.
+        """
+        placement = cls(piece=None, score=0.0, total=0.0, parent=None, size=0, key=0)
+        for piece in pieces:
+            placement = placement.extend(piece, 0.0)
+        return placement
+
+    def extend(self, piece, score, pairs=1):
+        """
+        Get a new placement of a piece after this one, touching pairs
+        neighbors with a mean score.
+        """
+        return Placement(
+            piece=piece,
+            score=score,
+            total=self.total + score * pairs,
+            parent=self,
+            size=self.size + 1,
+            key=self.key ^ hash(piece),
+        )
+
+    def pieces(self):
+        """
+        Get the placed pieces of the chain, in the order they were placed.
+        """
+        pieces = []
+        placement = self
+        while placement.piece is not None:
+            pieces.append(placement.piece)
+            placement = placement.parent
+        return pieces[::-1]
+
+    def placements(self, since=0):
+        """
+        Get the placements of the chain after the first since of them.
+        """
+        placements = []
+        placement = self
+        while placement.size > since:
+            placements.append(placement)
+            placement = placement.parent
+        return placements[::-1]
+
+    def to_board(self, width, height, frame=False, rotations=False):
+        """
+        Make the board of a chain, placing pieces in order.
+        """
+        board = Board(width, height, frame=frame, rotations=rotations)
+        for piece in self.pieces():
+            board.place(piece.index, piece.loc, piece.rotation)
+        return board
+
+
+class Board:
+    def __init__(self, width, height, frame=False, rotations=False):
+        """
+        The placement state of a puzzle on a bounded grid of pieces.
+
+        The grid holds the index of the piece covering each cell (or -1),
+        rotation the quarter turns it was placed with, and open marks empty
+        cells alongside a placed piece. The first piece can end up anywhere
+        in the solution, so the grid starts with room for a width by height
+        puzzle in every direction from location (0, 0), and grows if a
+        placement reaches its border.
+
+        With frame=True the covered pieces must fit in a width by height
+        frame, so cells that would make them wider or taller are never open.
+        Once the covered pieces span the frame across or down, its sides are
+        known, and open_locations gives corners and then sides first.
+
+        With rotations=True the pieces can be turned, so the solution can
+        also be a height by width frame. Both frames are kept (self.frames)
+        until the covered pieces no longer fit in one of them.
+        """
+        self.width = width
+        self.height = height
+        self.frame = frame
+        self.rotations = rotations
+        self.frames = [(width, height)]
+        if rotations and width != height:
+            self.frames.append((height, width))
+
+        # Covered locations span x0 to x1 across and y0 to y1 down
+        self.bounds = None
+        shape = (2 * height + 1, 2 * width + 1)
+        self.grid = np.full(shape, -1, dtype=np.intp)
+        self.rotation = np.zeros(shape, dtype=np.int8)
+        self.open = np.zeros(shape, dtype=bool)
+
+        # Order in which cells were opened, to enumerate open cells stably
+        self.opened = np.zeros(shape, dtype=np.intp)
+        self.count_opened = 0
+
+        # The grid column and row of location (0, 0)
+        self.origin = (width, height)
+
+    def cell(self, loc):
+        """
+        Get the grid (row, column) of an x,y location.
+        """
+        return loc[1] + self.origin[1], loc[0] + self.origin[0]
+
+    def location(self, row, col):
+        """
+        Get the x,y location of a grid (row, column).
+        """
+        return (int(col) - self.origin[0], int(row) - self.origin[1])
+
+    def in_grid(self, loc):
+        row, col = self.cell(loc)
+        return 0 <= row < self.grid.shape[0] and 0 <= col < self.grid.shape[1]
+
+    def index(self, loc):
+        """
+        Get the piece index at a location, or -1 if it is not covered.
+        """
+        if not self.in_grid(loc):
+            return -1
+        return self.grid[self.cell(loc)]
+
+    def is_covered(self, loc):
+        return self.index(loc) >= 0
+
+    def piece(self, loc):
+        """
+        Get the placed piece at a location, or None if it is not covered.
+        """
+        index = self.index(loc)
+        if index < 0:
+            return None
+        return PlacedPiece(
+            index=int(index), loc=loc, rotation=int(self.rotation[self.cell(loc)])
+        )
+
+    def is_open(self, loc):
+        return self.in_grid(loc) and self.open[self.cell(loc)]
+
+    def in_frame(self, loc):
+        """
+        Determine if a piece at loc would keep the covered pieces in the frame.
+        """
+        if not self.frame or self.bounds is None:
+            return True
+        x0, y0, x1, y1 = self.bounds
+        across = max(x1, loc[0]) - min(x0, loc[0]) + 1
+        down = max(y1, loc[1]) - min(y0, loc[1]) + 1
+        return any(across <= width and down <= height for width, height in self.frames)
+
+    @property
+    def pinned(self):
+        """
+        Get whether the sides of the frame are known, (across, down).
+
+        While the covered pieces fit either frame orientation, no side is.
+        """
+        if not self.frame or self.bounds is None or len(self.frames) > 1:
+            return (False, False)
+        x0, y0, x1, y1 = self.bounds
+        width, height = self.frames[0]
+        return (x1 - x0 + 1 == width, y1 - y0 + 1 == height)
+
+    def priority(self, loc):
+        """
+        Count the known sides of the frame that a location is on, so
+        corners are 2, other sides 1 and the rest 0.
+        """
+        pinned = self.pinned
+        if not any(pinned):
+            return 0
+        x0, y0, x1, y1 = self.bounds
+        return int(pinned[0] and loc[0] in (x0, x1)) + int(
+            pinned[1] and loc[1] in (y0, y1)
+        )
+
+    def place(self, index, loc, rotation=0):
+        """
+        Place a piece index at a location, opening its empty neighbors.
+        """
+        if self.is_covered(loc):
+            raise ValueError(
+                "Location %s already occupied."
+                % (PlacedPiece(index=index, loc=loc, rotation=rotation),)
+            )
+        if not self.in_frame(loc):
+            raise ValueError("Location %s is outside the frame." % (loc,))
+        self.fit(loc)
+        row, col = self.cell(loc)
+        self.grid[row, col] = index
+        self.rotation[row, col] = rotation
+        self.open[row, col] = False
+
+        x, y = loc
+        bounds = self.bounds or (x, y, x, y)
+        self.bounds = (
+            min(bounds[0], x),
+            min(bounds[1], y),
+            max(bounds[2], x),
+            max(bounds[3], y),
+        )
+
+        # Close open cells that the frame no longer reaches
+        if self.frame and self.bounds != bounds:
+            self.fit_frames()
+            rows, cols = np.nonzero(self.open)
+            xs, ys = cols - self.origin[0], rows - self.origin[1]
+            x0, y0, x1, y1 = self.bounds
+            across = np.maximum(x1, xs) - np.minimum(x0, xs) + 1
+            down = np.maximum(y1, ys) - np.minimum(y0, ys) + 1
+            inside = np.zeros(len(rows), dtype=bool)
+            for width, height in self.frames:
+                inside |= (across <= width) & (down <= height)
+            self.open[rows[~inside], cols[~inside]] = False
+
+        for neighbor in {(x, y - 1), (x, y + 1), (x + 1, y), (x - 1, y)}:
+            cell = self.cell(neighbor)
+            if self.grid[cell] < 0 and not self.open[cell] and self.in_frame(neighbor):
+                self.open[cell] = True
+                self.opened[cell] = self.count_opened
+                self.count_opened += 1
+
+    def fit_frames(self):
+        """
+        Keep the frame orientations that the covered pieces still fit in.
+        """
+        x0, y0, x1, y1 = self.bounds
+        self.frames = [
+            (width, height)
+            for width, height in self.frames
+            if x1 - x0 < width and y1 - y0 < height
+        ]
+
+    def fit(self, loc):
+        """
+        Grow the grid so a location and its neighbors are inside it.
+        """
+        row, col = self.cell(loc)
+        rows, cols = self.grid.shape
+        before = (rows if row < 1 else 0, cols if col < 1 else 0)
+        after = (rows if row > rows - 2 else 0, cols if col > cols - 2 else 0)
+        if not any(before + after):
+            return
+        padding = ((before[0], after[0]), (before[1], after[1]))
+        self.grid = np.pad(self.grid, padding, constant_values=-1)
+        self.rotation = np.pad(self.rotation, padding)
+        self.open = np.pad(self.open, padding)
+        self.opened = np.pad(self.opened, padding)
+        self.origin = (self.origin[0] + before[1], self.origin[1] + before[0])
+
+    def neighbors(self, loc):
+        """
+        Get the placed pieces alongside a location.
+        """
+        x, y = loc
+        placed = []
+        for neighbor in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+            piece = self.piece(neighbor)
+            if piece is not None:
+                placed.append(piece)
+        return placed
+
+    def open_locations(self, sides_first=True):
+        """
+        Get open locations, in the order that they were opened.
+
+        In a frame with known sides, only the open locations on the most
+        sides (corners, then sides) are given, unless sides_first is False.
+        """
+        rows, cols = np.nonzero(self.open)
+        order = np.argsort(self.opened[rows, cols], kind="stable")
+        locations = [self.location(rows[i], cols[i]) for i in order]
+        if sides_first and locations and any(self.pinned):
+            priorities = [self.priority(loc) for loc in locations]
+            first = max(priorities)
+            locations = [
+                loc for loc, priority in zip(locations, priorities) if priority == first
+            ]
+        return locations
+
+    def count_pairs(self):
+        """
+        Count the pairs of covered neighbors, across and down.
+        """
+        covered = self.grid >= 0
+        return int(
+            np.count_nonzero(covered[:, :-1] & covered[:, 1:])
+            + np.count_nonzero(covered[:-1] & covered[1:])
+        )
+
+    def covered_places(self):
+        """
+        Get a lookup of covered locations to piece index.
+        """
+        rows, cols = np.nonzero(self.grid >= 0)
+        return {
+            self.location(row, col): int(self.grid[row, col])
+            for row, col in zip(rows, cols)
+        }
+
+    def layout(self, grid=None):
+        """
+        Get the piece index at each (row, column) of the covered bounding
+        box of the board, with -1 for empty cells. Give another grid (e.g.,
+        self.rotation) to crop it to the same box.
+        """
+        grid = self.grid if grid is None else grid
+        rows, cols = np.nonzero(self.grid >= 0)
+        if not len(rows):
+            return np.empty((0, 0), dtype=grid.dtype)
+        return grid[rows.min() : rows.max() + 1, cols.min() : cols.max() + 1]
+
+    def normalize(self):
+        """
+        Shift locations so that covered pieces start at (0, 0).
+        """
+        rows, cols = np.nonzero(self.grid >= 0)
+        if len(rows):
+            self.origin = (int(cols.min()), int(rows.min()))
+
+    def copy(self):
+        """
+        Get a copy of the board, to place pieces on without changing this one.
+        """
+        board = copy.copy(self)
+        board.grid = self.grid.copy()
+        board.rotation = self.rotation.copy()
+        board.open = self.open.copy()
+        board.opened = self.opened.copy()
+        return board
+
+    def get_state(self):
+        """
+        Get the board as a dictionary of arrays, e.g., to save with numpy.
+        """
+        return {
+            "grid": self.grid,
+            "rotation": self.rotation,
+            "open": self.open,
+            "opened": self.opened,
+            "count_opened": np.array(self.count_opened),
+            "origin": np.array(self.origin),
+            "frame": np.array(self.frame),
+            "rotations": np.array(self.rotations),
+            "size": np.array((self.width, self.height)),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """
+        Restore a board from get_state.
+        """
+        width, height = state["size"] if "size" in state else (0, 0)
+        board = cls(
+            int(width),
+            int(height),
+            frame="frame" in state and bool(state["frame"]),
+            rotations="rotations" in state and bool(state["rotations"]),
+        )
+        board.grid = np.array(state["grid"], dtype=np.intp)
+        if "rotation" in state:
+            board.rotation = np.array(state["rotation"], dtype=np.int8)
+        else:
+            board.rotation = np.zeros(board.grid.shape, dtype=np.int8)
+        board.open = np.array(state["open"], dtype=bool)
+        board.opened = np.array(state["opened"], dtype=np.intp)
+        board.count_opened = int(state["count_opened"])
+        board.origin = tuple(int(x) for x in state["origin"])
+        rows, cols = np.nonzero(board.grid >= 0)
+        if len(rows):
+            x0, y0 = board.location(rows.min(), cols.min())
+            x1, y1 = board.location(rows.max(), cols.max())
+            board.bounds = (x0, y0, x1, y1)
+            board.fit_frames()
+        return board
+
+    def __len__(self):
+        return int(np.count_nonzero(self.grid >= 0))
@@ -0,0 +1,155 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from puzzles.logger import logger
+
+import collections
+import hashlib
+import numpy as np
+import os
+import tempfile
+
+
+def hash_image(image, block_size=2**24):
+    """
+    Get a content hash of an image array, reading it in blocks of rows.
+
+    Hashing in blocks keeps memory bounded for memory mapped images.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(("%s:%s" % (image.shape, image.dtype.str)).encode("utf-8"))
+    row_size = max(1, image[0].nbytes)
+    step = max(1, block_size // row_size)
+    for start in range(0, image.shape[0], step):
+        hasher.update(np.ascontiguousarray(image[start : start + step]).tobytes())
+    return hasher.hexdigest()
+
+
+class DistanceCache:
+    def __init__(self, cache_dir):
+        """
+        A persistent cache of piece distances, one .npz file per key.
+
+        Distances are stored in tile order (the order of pieces before any
+        shuffle), so a shuffled puzzle can reuse them through its order.
+        """
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_key(self, image_hash, **settings):
+        """
+        Derive a cache key from an image hash and the settings that change
+        the distances (e.g., min_piece_size, max_rgb and the metric name).
+        """
+        hasher = hashlib.sha256(image_hash.encode("utf-8"))
+        for name in sorted(settings):
+            hasher.update(("%s=%s;" % (name, settings[name])).encode("utf-8"))
+        return hasher.hexdigest()
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, "%s.npz" % key)
+
+    def load(self, key):
+        """
+        Load cached distances for a key, or None if there are none.
+        """
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                return data["distances"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable distance cache %s: %s" % (path, e))
+            return None
+
+    def save(self, key, distances):
+        """
+        Save distances for a key.
+
+        The file is written to a temporary name and renamed into place, so
+        processes sharing a cache never read a partial file.
+        """
+        fd, tmpfile = tempfile.mkstemp(dir=self.cache_dir, suffix=".npz")
+        with os.fdopen(fd, "wb") as filey:
+            np.savez(filey, distances=distances)
+        os.replace(tmpfile, self.get_path(key))
+        return self.get_path(key)
+
+
+class DistanceMemo:
+    def __init__(self):
+        """
+        An unbounded memo of piece distances, keyed by (p1, e1, p2, e2).
+
+        Lookups are counted as hits or misses, and any evictions are counted
+        too, to see how well memoization is working for a puzzle.
+        """
+        self.data = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Get a memoized distance, or None if it is not known.
+        """
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+
+    def clear(self):
+        self.data.clear()
+
+    def reset_stats(self):
+        """
+        Zero the hit, miss and eviction counts, keeping memoized distances.
+        """
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self),
+        }
+
+
+class LRUDistanceMemo(DistanceMemo):
+    def __init__(self, max_entries):
+        """
+        A memo of piece distances that evicts the least recently used entry
+        once it holds max_entries, to cap memory on large puzzles.
+        """
+        super().__init__()
+        if max_entries < 1:
+            raise ValueError("max_entries should be at least 1. Got %s." % max_entries)
+        self.max_entries = max_entries
+        self.data = collections.OrderedDict()
+
+    def get(self, key):
+        value = super().get(key)
+        if value is not None:
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_entries:
+            self.data.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,170 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import collections
+
+import numpy as np
+
+# A named, batched edge compatibility metric, see register_metric
+Metric = collections.namedtuple("Metric", ["name", "func", "depth"])
+
+# Lookup of metric name to Metric
+metrics = {}
+
+
+def register_metric(name, depth=1):
+    """
+    Register a batched edge compatibility metric under a name.
+
+    The metric is called as func(strips1, strips2, max_rgb) with strips of
+    shape (n1, depth, L[, C]) and (n2, depth, L[, C]), each running clockwise
+    around its own piece with strip 0 at the border (see extract_edges). It
+    returns an (n1, n2) array of scores for placing each edge of strips1
+    against each edge of strips2, lower being a better match. depth is the
+    number of strips the metric looks at.
+    """
+
+    def register(func):
+        metrics[name] = Metric(name=name, func=func, depth=depth)
+        return func
+
+    return register
+
+
+def get_metric(name):
+    """
+    Get a registered metric by name.
+    """
+    if name not in metrics:
+        raise ValueError(
+            "metric should be one of %s. Got %s." % (", ".join(sorted(metrics)), name)
+        )
+    return metrics[name]
+
+
+def aligned(strips1, strips2, depth):
+    """
+    Prepare two stacks of strips for pairwise comparison.
+
+    Returns float copies of the first depth strips as (n, depth, L, C),
+    with strips2 reversed along the edge so that positions line up with
+    strips1 when the two pieces touch.
+    """
+    strips1 = strips1[:, :depth].astype(float)
+    strips2 = strips2[:, :depth, ::-1].astype(float)
+    if strips1.ndim == 3:
+        strips1, strips2 = strips1[..., None], strips2[..., None]
+    return strips1, strips2
+
+
+def mismatched(strips1, strips2):
+    """
+    Edges of different lengths (or colors) can never match.
+    """
+    if strips1.shape[2:] != strips2.shape[2:]:
+        return np.full((len(strips1), len(strips2)), np.inf)
+
+
+@register_metric("wrapped_l1")
+def wrapped_l1(strips1, strips2, max_rgb=255):
+    """
+    The original score: log of the 1-norm of the wrapped color difference.
+
+    This works on the image dtype as the original edge_matching_score did,
+    so for integer images the difference wraps around (e.g., mod 256 for
+    uint8) before taking min(diff, max_rgb - diff). It is kept as the
+    default so solutions don't change. The 1-norm of an (L, C) edge is
+    its largest column sum, and the result is promoted to float like la.norm.
+    """
+    inf = mismatched(strips1, strips2)
+    if inf is not None:
+        return inf
+    edge_diff = strips1[:, None, 0] - strips2[None, :, 0, ::-1]
+    edge_diff = np.abs(np.minimum(edge_diff, max_rgb - edge_diff))
+    if not np.issubdtype(edge_diff.dtype, np.inexact):
+        edge_diff = edge_diff.astype(float)
+    norms = edge_diff.sum(axis=2)
+    if norms.ndim == 3:
+        norms = norms.max(axis=2)
+    with np.errstate(divide="ignore"):
+        return np.log(norms)
+
+
+@register_metric("ssd")
+def sum_squared_differences(strips1, strips2, max_rgb=255):
+    """
+    Dissimilarity: the sum of squared differences between border pixels.
+    """
+    inf = mismatched(strips1, strips2)
+    if inf is not None:
+        return inf
+    strips1, strips2 = aligned(strips1, strips2, 1)
+    edge_diff = strips1[:, None, 0] - strips2[None, :, 0]
+    return np.einsum("ijlc,ijlc->ij", edge_diff, edge_diff)
+
+
+def gradient_statistics(strips, regularize=1e-3):
+    """
+    Mean and inverse covariance of color gradients across a border.
+
+    The covariance is regularized by a fraction of its own scale, so flat
+    edges (with no variation in gradient) still have an inverse.
+    """
+    gradients = strips[:, 0] - strips[:, 1]
+    mean = gradients.mean(axis=1)
+    centered = gradients - mean[:, None]
+    covariance = np.einsum("nlc,nld->ncd", centered, centered) / gradients.shape[1]
+    channels = covariance.shape[-1]
+    scale = np.trace(covariance, axis1=1, axis2=2) / channels
+    identity = np.eye(channels)
+    covariance += (regularize * scale + 1e-6)[:, None, None] * identity
+    return mean, np.linalg.inv(covariance)
+
+
+@register_metric("mgc", depth=2)
+def mahalanobis_gradient_compatibility(strips1, strips2, max_rgb=255):
+    """
+    Mahalanobis gradient compatibility (Gallagher, 2012).
+
+    The color gradient across the boundary of two pieces should look like
+    the gradients just inside each piece, which is measured with the
+    Mahalanobis distance under each piece's gradient mean and covariance,
+    summed along the edge and over both sides.
+    """
+    inf = mismatched(strips1, strips2)
+    if inf is not None:
+        return inf
+    strips1, strips2 = aligned(strips1, strips2, 2)
+    mean1, inverse1 = gradient_statistics(strips1)
+    mean2, inverse2 = gradient_statistics(strips2)
+
+    # Gradient from piece 1 across the boundary into piece 2
+    boundary = strips2[None, :, 0] - strips1[:, None, 0]
+    deviation = boundary - mean1[:, None, None]
+    score = np.einsum("ijlc,icd,ijld->ij", deviation, inverse1, deviation)
+
+    # And from piece 2 into piece 1
+    deviation = -boundary - mean2[None, :, None]
+    score += np.einsum("ijlc,jcd,ijld->ij", deviation, inverse2, deviation)
+    return score
+
+
+@register_metric("prediction", depth=2)
+def prediction(strips1, strips2, max_rgb=255, p=0.3, q=1 / 16):
+    """
+    Prediction-based compatibility (Pomeranz et al., 2011).
+
+    Each piece extrapolates its border one pixel across the boundary, and
+    the prediction is compared with the other piece's border under the
+    (L_p)^q norm, summed over both directions.
+    """
+    inf = mismatched(strips1, strips2)
+    if inf is not None:
+        return inf
+    strips1, strips2 = aligned(strips1, strips2, 2)
+    predicted1 = 2 * strips1[:, 0] - strips1[:, 1]
+    predicted2 = 2 * strips2[:, 0] - strips2[:, 1]
+    error = np.abs(predicted1[:, None] - strips2[None, :, 0]) ** p
+    error += np.abs(predicted2[None, :] - strips1[:, None, 0]) ** p
+    return error.sum(axis=(2, 3)) ** (q / p)
@@ -2,83 +2,284 @@ __author__ = "Vanessa Sochat"
 __copyright__ = "Copyright 2017-2021, Vanessa Sochat"
 __license__ = "MPL 2.0"
 
+from puzzles.board import Board, PlacedPiece, Placement
+from puzzles.cache import DistanceCache, DistanceMemo, LRUDistanceMemo, hash_image
 from puzzles.logger import logger
-from puzzles.utils import get_temporary_name
+from puzzles.metrics import get_metric
+from puzzles.parallel import attach_puzzle, share_array, solve_start
+from puzzles.render import draw_grid_lines, draw_labels, render_layout, rotate_pieces
+from puzzles.stats import SolveStats
+from puzzles.utils import get_temporary_name, read_image, write_image
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import collections
+import copy
+import heapq
 import numpy as np
 from numpy import linalg as la
 
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
-
 import os
 import sys
+import tempfile
 
-
-class PlacedPiece:
-    def __init__(self, index, loc):
-
-        # The index of the piece in the puzzle array
-        self.index = index
-
-        # The x,y coordinate, not pixel location but piece location
-        self.loc = loc
-
-    def __str__(self):
-        return "PuzzlePiece(index=%s, loc=%s)" % (self.index, self.loc)
-
-    def __repr__(self):
-        return self.__str__()
+# The state of a board in a beam search (see iter_beam): the board, a mask of
+# its unused pieces, and for each open location its best (score, index,
+# rotation) moves in order with whether they are all of its moves and when it
+# was opened, and the set of pieces in its moves
+BeamState = collections.namedtuple("BeamState", ["board", "unused", "moves", "pieces"])
 
 
 class PhotoPuzzle:
-    def __init__(self, image, max_rgb=255, min_piece_size=30, font=None):
+    def __init__(
+        self,
+        image,
+        max_rgb=255,
+        min_piece_size=30,
+        font=None,
+        mmap=False,
+        edges_only=False,
+        edge_depth=1,
+        metric="wrapped_l1",
+        rotations=False,
+        frame=False,
+        workers=1,
+        cache_dir=None,
+        cache_policy="dense",
+        cache_size=1000000,
+        top_k=None,
+        beam_width=4,
+        backtrack_score=None,
+        profile=False,
+        progress_every=None,
+    ):
         """
         Generate a puzzle from a photo and solve it.
+
+        For very large photos, set mmap to True (or to the path of a .npy
+        file) to decode the image once into a .npy cache and memory map it,
+        so pieces and edges are read from disk pages as they are used.
+        A .npy image is always memory mapped.
+
+        Solving only looks at piece edges. With edges_only=True the edge
+        strips (edge_depth pixels deep) of all pieces are extracted when the
+        puzzle is made and the image is let go until something is rendered.
+
+        Edges are compared with a metric from puzzles.metrics: "wrapped_l1"
+        (the original score), "ssd", "mgc" or "prediction". Metrics that look
+        past the border pixels raise edge_depth to the depth they need.
+
+        With rotations=True pieces can be turned: shuffle gives each piece a
+        random number of clockwise quarter turns (self.orientation), and
+        the greedy strategy places each piece with a rotation. Distances
+        then cover all 4x4 pairings of edges. This needs square pieces.
+
+        With frame=True pieces are only placed where they fit in a frame of
+        horizontal_num_pieces by vertical_num_pieces (or, with rotations,
+        either way around), and once the sides of the frame are known,
+        corners and then sides are filled first (see Board). This also
+        leaves fewer open locations to score.
+
+        Distances between pieces are computed in tiles across a pool of
+        workers threads (None to use all cores). Set cache_dir to keep them
+        on disk, keyed by a hash of the image and the solver settings, so
+        solving the same photo again (in any shuffle) reuses them.
+
+        The cache_policy decides how distances are kept in memory: "dense"
+        precomputes the full distance array, while "unbounded" memoizes each
+        distance as it is needed and "lru" memoizes at most cache_size
+        distances. See cache_stats for hit, miss and eviction counts.
+
+        With top_k, greedy solves only score the pieces at a location that
+        are among the top_k matches of its placed neighbors' edges (see
+        get_candidates), and fall back to every unused piece once those
+        are used up. The "mst" strategy joins the top_k matches (8 by
+        default) of each edge.
+
+        The "beam" strategy keeps the beam_width best partial boards, and
+        searches a step again twice as wide when its best placement scores
+        above backtrack_score (see iter_beam).
+
+        With profile=True, solve records time per phase, find_score calls
+        and placement latency in self.stats (see get_stats and log_stats),
+        and progress_every logs progress every so many placements.
         """
+        if cache_policy not in ("dense", "unbounded", "lru"):
+            raise ValueError(
+                "cache_policy should be 'dense', 'unbounded' or 'lru'. Got %s."
+                % cache_policy
+            )
         # Solver settings
         self.max_rgb = max_rgb
         self.min_piece_size = min_piece_size
+        self.mmap = mmap
+        self.edges_only = edges_only
+        self.metric = get_metric(metric)
+        self.edge_depth = max(edge_depth, self.metric.depth)
+        self.rotations = rotations
+        self.frame = frame
+        self.workers = workers or os.cpu_count()
+
+        # Edge strips for all pieces, see extract_edges
+        self.edges = None
+
+        # Solve instrumentation
+        self.stats = SolveStats(enabled=profile, progress_every=progress_every)
 
         # If we generate puzzle images with text
         self.font = font or self.default_font()
         self.cmap = "gray"
 
-        # Dictionary mapping each open location to a set of placed pieces.
-        # Note that an open location means edges alongside a placed piece
-        self.open_places = collections.defaultdict(set)
-
-        # Locations of covered places to piece index.
-        self.covered_places = {}
-
         # Lookup of piece distances
-        self.piece_distances = {}
-
-        self.pieces = []
-        self.load_image(image)
+        self.cache_policy = cache_policy
+        if cache_policy == "lru":
+            self.piece_distances = LRUDistanceMemo(cache_size)
+        else:
+            self.piece_distances = DistanceMemo()
+
+        # Precomputed (N, 4, N) array of opposing edge distances
+        self.distances = None
+
+        # Index of the top_k matches for each piece edge, see get_candidates
+        if top_k is not None and top_k < 1:
+            raise ValueError("top_k should be at least 1. Got %s." % top_k)
+        if top_k and rotations:
+            raise ValueError("top_k is not supported with rotations.")
+        self.top_k = top_k
+        self.candidates = None
+
+        # Beam search settings
+        if beam_width < 1:
+            raise ValueError("beam_width should be at least 1. Got %s." % beam_width)
+        self.beam_width = beam_width
+        self.backtrack_score = backtrack_score
+
+        self.load_image(image, mmap=mmap)
+
+        # Persistent distances, keyed by image content
+        self.distance_cache = None
+        if cache_dir:
+            self.distance_cache = DistanceCache(cache_dir)
+            self.image_hash = hash_image(self.image)
         self.generate_pieces()
+        if rotations and self.piece_height != self.piece_width:
+            raise ValueError(
+                "rotations need square pieces. Got %sx%s."
+                % (self.piece_width, self.piece_height)
+            )
+
+        # Grid of covered and open places, sized from the number of pieces
+        self.reset_board()
 
     def generate_pieces(self):
         """
         Given a loaded puzzle image, generate some number of pieces.
+
+        Pieces are not copied out of the image. self.tiles is a strided view
+        over it with shape (horizontal, vertical, height, width[, color]),
+        so tile i * vertical_num_pieces + j is the piece in column i and
+        row j. self.order maps each piece index to its tile, and shuffling
+        permutes the order instead of moving piece data. self.orientation
+        holds the clockwise quarter turns of each piece from its tile, and
+        self.permutation the pieces drawn by the last shuffle.
         """
-        for i in range(self.horizontal_num_pieces):
-            for j in range(self.vertical_num_pieces):
-                # Split into pieces with dimensions x, y, and color
-                self.pieces.append(
-                    self.image[
-                        j * self.piece_height : (j + 1) * self.piece_height,
-                        i * self.piece_width : (i + 1) * self.piece_width,
-                        :,
-                    ]
-                )
+        self.tiles = self.make_tiles()
+        self.order = np.arange(self.vertical_num_pieces * self.horizontal_num_pieces)
+        self.orientation = np.zeros(len(self.order), dtype=int)
+        self.permutation = np.arange(len(self.order))
+        if self.edges_only:
+            self.extract_edges()
+            self.discard_pieces()
+
+    def make_tiles(self):
+        """
+        Make the strided view of pieces over the loaded image.
+        """
+        rows, cols = self.vertical_num_pieces, self.horizontal_num_pieces
+        height, width = self.piece_height, self.piece_width
+        image = self.image[: rows * height, : cols * width]
+        return np.lib.stride_tricks.as_strided(
+            image,
+            shape=(cols, rows, height, width) + image.shape[2:],
+            strides=(width * image.strides[1], height * image.strides[0])
+            + image.strides,
+            writeable=False,
+        )
+
+    def load_pieces(self):
+        """
+        Reload the image and pieces if they were discarded.
+        """
+        if self.tiles is None:
+            self.load_image(self.image_file, mmap=self.mmap)
+            self.tiles = self.make_tiles()
+
+    def discard_pieces(self):
+        """
+        Let go of the image and pieces, keeping only extracted edges.
+        """
+        if self.edges is None:
+            self.extract_edges()
+        self.image = None
+        self.tiles = None
+
+    def extract_edges(self):
+        """
+        Extract the edge strips of every tile into compact arrays.
+
+        self.edges[e] has shape (N, edge_depth, L[, C]) in tile order. Strips
+        run clockwise around the piece like get_piece_edges, and strip k is k
+        pixels in from the border. Top and bottom strips have the piece width
+        as length and left and right strips the piece height, so for square
+        pieces np.stack(self.edges, axis=1) is one (N, 4, depth, L[, C]) array.
+        """
+        depth = self.edge_depth
+        if not 1 <= depth <= min(self.piece_height, self.piece_width):
+            raise ValueError(
+                "edge_depth should be between 1 and the piece size. Got %s." % depth
+            )
+        self.load_pieces()
+        tiles = self.tiles
+        strips = [
+            tiles[:, :, :depth, :],
+            np.swapaxes(tiles[:, :, :, : -depth - 1 : -1], 2, 3),
+            tiles[:, :, : -depth - 1 : -1, ::-1],
+            np.swapaxes(tiles[:, :, ::-1, :depth], 2, 3),
+        ]
+
+        # Copy so that edges don't hold on to the image
+        self.edges = [
+            np.array(strip).reshape((-1,) + strip.shape[2:]) for strip in strips
+        ]
+        return self.edges
+
+    @property
+    def pieces(self):
+        """
+        All pieces in their current order, as one (N, height, width[, color])
+        array. The tiles can't be merged into a single axis without copying,
+        so this gathers them into one contiguous buffer on each access.
+        Use get_piece to look at a single piece without a copy.
+        """
+        self.load_pieces()
+        tiles = self.tiles.reshape((-1,) + self.tiles.shape[2:])
+        return rotate_pieces(tiles[self.order], self.orientation)
+
+    def get_piece(self, p, rotation=0):
+        """
+        Get a view of the piece at index p, turned by its orientation and
+        then by rotation clockwise quarter turns.
+        """
+        self.load_pieces()
+        tile = self.tiles[divmod(self.order[p], self.vertical_num_pieces)]
+        return np.rot90(tile, -((self.orientation[p] + rotation) % 4))
 
     def __exit__(self):
         """
         Close plots on instance destruction
         """
-        plt.close()
+        # Only if plots were made, matplotlib is imported when needed
+        if "matplotlib.pyplot" in sys.modules:
+            sys.modules["matplotlib.pyplot"].close()
 
     def metrics(self):
         """
@@ -90,22 +291,56 @@ class PhotoPuzzle:
         logger.info("Height             : %s" % self.height)
         logger.info("Number pieces      : %s" % self.count_pieces())
 
-    def load_image(self, image):
+    def load_image(self, image, mmap=False):
         """
         Load the image to turn into a puzzle.
+
+        If mmap is True or a path, the decoded image is cached to a .npy file
+        (by default alongside the image) and loaded as a read only memory map.
         """
         if not os.path.exists(image):
             logger.exit("%s does not exist." % image)
         self.image_file = image
         self.filename = os.path.basename(image)
-        self.image = mpimg.imread(image)
+        if image.endswith(".npy"):
+            self.image = np.load(image, mmap_mode="r")
+        elif mmap:
+            cache_file = mmap if isinstance(mmap, str) else "%s.npy" % image
+            self.image = self.load_image_cache(image, cache_file)
+        else:
+            self.image = read_image(image)
         self.height, self.width = self.image.shape[0:2]
 
+    def load_image_cache(self, image, cache_file):
+        """
+        Memory map a decoded copy of an image, converting it once if needed.
+
+        The cache is rewritten when the image is newer than it, to a
+        temporary name that is renamed into place, so other processes never
+        map a partial file. Decoding still needs the whole image in memory
+        once, but later loads only page in the parts of the image that are
+        read.
+        """
+        stale = not os.path.exists(cache_file) or (
+            os.path.getmtime(cache_file) < os.path.getmtime(image)
+        )
+        if stale:
+            logger.info("Caching decoded %s to %s" % (image, cache_file))
+            directory, name = os.path.split(os.path.abspath(cache_file))
+            fd, tmpfile = tempfile.mkstemp(dir=directory, prefix=name, suffix=".tmp")
+            with os.fdopen(fd, "wb") as filey:
+                np.save(filey, read_image(image))
+            os.replace(tmpfile, cache_file)
+        return np.load(cache_file, mmap_mode="r")
+
     def get_image_figure(self, title=None, show=True):
         """
         Get a plot of the entire image.
         """
+        import matplotlib.pyplot as plt
+
         # TODO what's th eright way to close tis?
+        self.load_pieces()
         fig = plt.figure(figsize=(self.vertical_num_pieces, self.horizontal_num_pieces))
         plt.imshow(self.image, cmap=self.cmap)
 
@@ -119,10 +354,77 @@ class PhotoPuzzle:
     def shuffle(self):
         """
         Shuffle the pieces, and reset open and covered pieces.
+
+        The permutation is kept in self.permutation (piece i is the piece
+        at permutation[i] before the shuffle), and the original layout of
+        the pieces in self.order, to check a solve against (see
+        direct_accuracy and neighbor_accuracy).
+        """
+        shuffled = np.random.permutation(self.count_pieces())
+        orientation = None
+        if self.rotations:
+            orientation = np.random.randint(4, size=self.count_pieces())
+        self.set_order(self.order[shuffled], orientation)
+        self.permutation = shuffled
+        self.reset_board()
+
+    def set_order(self, order, orientation=None):
+        """
+        Set the tile of each piece index, keeping distances in step.
+
+        With rotations, orientation sets the clockwise quarter turns of
+        each piece from its tile. By default tiles keep their turns.
+        """
+        order = np.asarray(order)
+        moved = np.argsort(self.order)[order]
+        if orientation is None:
+            orientation = self.orientation[moved]
+        orientation = np.asarray(orientation) % 4
+        if orientation.any() and not self.rotations:
+            raise ValueError("Pieces can only be turned with rotations=True.")
+
+        # Distances are indexed by piece, so follow the pieces around
+        if self.distances is not None and self.distances.ndim == 3:
+            self.distances = self.distances[moved][:, :, moved]
+
+        # And edge e of a piece is edge (e + turns) % 4 of it before
+        elif self.distances is not None:
+            turns = self.orientation[moved] - orientation
+            edges = (np.arange(4) + turns[:, None]) % 4
+            self.distances = self.gather_distances(self.distances, moved, edges)
+        self.piece_distances.clear()
+        self.candidates = None
+        self.order = order
+        self.orientation = orientation
+
+    def reset_board(self):
+        """
+        Reset open and covered places to an empty board.
+        """
+        self.board = Board(
+            self.horizontal_num_pieces,
+            self.vertical_num_pieces,
+            frame=self.frame,
+            rotations=self.rotations,
+        )
+
+    @property
+    def open_places(self):
+        """
+        Dictionary mapping each open location to a set of placed pieces.
+
+        Note that an open location means edges alongside a placed piece
         """
-        np.random.shuffle(self.pieces)
-        self.open_places = collections.defaultdict(set)
-        self.covered_places = {}
+        return {
+            loc: set(self.board.neighbors(loc)) for loc in self.board.open_locations()
+        }
+
+    @property
+    def covered_places(self):
+        """
+        Locations of covered places to piece index.
+        """
+        return self.board.covered_places()
 
     def get_neighbors(self, x, y):
         """
@@ -134,49 +436,211 @@ class PhotoPuzzle:
         """
         Given a set of covered and open places, place a piece!
         """
-        if new_piece.loc in self.covered_places:
-            raise ValueError("Location %s already occupied." % new_piece)
-
-        # The new piece location is no longer open
-        self.open_places.pop(new_piece.loc, None)
-
-        # Add the piece to the lookup of covered places
-        self.covered_places[new_piece.loc] = new_piece.index
-
-        # The neighbors of the added piece
-        for neighbor in self.get_neighbors(*new_piece.loc):
-            if neighbor not in self.covered_places:
-                self.open_places[neighbor].add(new_piece)
+        self.board.place(new_piece.index, new_piece.loc, new_piece.rotation)
 
     def make_scores(self, unused_pieces_indices):
         """
-        Given unused piece indices, calculate
+        Given unused piece indices, calculate the mean score of each piece
+        at each open location. With a candidate index (see top_k), only the
+        candidates for each location are scored. Keys are (index, loc), or
+        (index, loc, rotation) with rotations, the fields of a PlacedPiece.
         """
         scores = {}
-        for new_piece_index in unused_pieces_indices:
-            for loc, placed_neighbors in self.open_places.items():
-                scores[new_piece_index, loc] = np.mean(
-                    [
-                        self.find_score(
-                            new_piece=PlacedPiece(index=new_piece_index, loc=loc),
-                            neighbor_piece=neighbor_piece,
-                        )
-                        for neighbor_piece in placed_neighbors
-                    ]
+        open_places = self.open_places
+
+        def score(index, loc, rotation=0):
+            return np.mean(
+                [
+                    self.find_score(
+                        new_piece=PlacedPiece(index=index, loc=loc, rotation=rotation),
+                        neighbor_piece=neighbor_piece,
+                    )
+                    for neighbor_piece in open_places[loc]
+                ]
+            )
+
+        if self.candidates is not None:
+            for loc in open_places:
+                candidates = unused_pieces_indices.intersection(
+                    self.get_location_candidates(loc).tolist()
                 )
+                for new_piece_index in sorted(candidates or unused_pieces_indices):
+                    scores[new_piece_index, loc] = score(new_piece_index, loc)
+            return scores
+
+        # Ties go to the first key, by piece index, rotation and then location
+        for new_piece_index in unused_pieces_indices:
+            if not self.rotations:
+                for loc in open_places:
+                    scores[new_piece_index, loc] = score(new_piece_index, loc)
+                continue
+            for rotation in range(4):
+                for loc in open_places:
+                    scores[new_piece_index, loc, rotation] = score(
+                        new_piece_index, loc, rotation
+                    )
         return scores
 
     def get_piece_distance(self, p1, e1, p2, e2):
         """
         Calculate and cache the distance between two pieces
         """
-        if (p1, e1, p2, e2) not in self.piece_distances:
-            edge1 = self.get_piece_edges(p1, e1)
-            edge2 = self.get_piece_edges(p2, e2)
-            self.piece_distances[p1, e1, p2, e2] = self.edge_matching_score(
-                edge1, edge2
-            )
-        return self.piece_distances[p1, e1, p2, e2]
+        if self.distances is not None and self.distances.ndim == 4:
+            self.piece_distances.hits += 1
+            return self.distances[p1, e1, p2, e2]
+        if self.distances is not None and e2 == (e1 + 2) % 4:
+            self.piece_distances.hits += 1
+            return self.distances[p1, e1, p2]
+        score = self.piece_distances.get((p1, e1, p2, e2))
+        if score is None:
+            strips1 = self.get_piece_strips(p1, e1)
+            strips2 = self.get_piece_strips(p2, e2)
+            score = self.score_strips(strips1[None], strips2[None])[0, 0]
+            self.piece_distances.put((p1, e1, p2, e2), score)
+        return score
+
+    def cache_stats(self):
+        """
+        Get hits, misses and evictions for distance lookups since the last
+        solve started, and the number of memoized distances. find_score
+        lookups into dense distances count as hits, while vectorized reads
+        are counted as dense_lookups in get_stats.
+        """
+        return dict(policy=self.cache_policy, **self.piece_distances.stats)
+
+    def get_stats(self):
+        """
+        Get instrumentation for the last solve, including cache statistics.
+        """
+        return self.stats.as_dict(cache=self.cache_stats())
+
+    def log_stats(self):
+        """
+        Write instrumentation for the last solve to the logger.
+        """
+        self.stats.log(cache=self.cache_stats())
+
+    def compute_distances(self, chunk_size=2**24):
+        """
+        Precompute the distance between every pair of opposing piece edges.
+
+        The result is an (N, 4, N) array where distances[p1, e1, p2] is the
+        score of edge e1 of piece p1 against edge (e1 + 2) % 4 of piece p2,
+        which are the only pairings that find_score asks for. With rotations
+        any edge can face any other, so the result is an (N, 4, N, 4) array
+        where distances[p1, e1, p2, e2] scores edge e1 against edge e2.
+
+        Each edge is stacked across all tiles and scored against the other
+        stack in tiles of roughly chunk_size elements, then put in piece
+        order. With more than one worker the tiles are filled by a thread
+        pool: NumPy releases the GIL for the array math, and threads share
+        the edge stacks and the output array instead of pickling them to
+        other processes.
+        """
+        num_pieces = self.count_pieces()
+        shape = (num_pieces, 4, num_pieces) + ((4,) if self.rotations else ())
+        if self.distance_cache is not None:
+            key = self.get_cache_key()
+            cached = self.distance_cache.load(key)
+            if cached is not None and cached.shape == shape:
+                self.distances = self.order_distances(cached)
+                return self.distances
+
+        with self.stats.timer("edges"):
+            if self.edges is None:
+                self.extract_edges()
+            strips = self.edges
+        distances = np.empty(shape)
+
+        # Tiles of rows for each pairing of edges, to keep every worker busy
+        if self.rotations:
+            pairings = [(e1, e2) for e1 in range(4) for e2 in range(4)]
+        else:
+            pairings = [(e1, (e1 + 2) % 4) for e1 in range(4)]
+        tiles = []
+        for e1, e2 in pairings:
+            step = max(1, chunk_size // max(1, strips[e2].size))
+            step = min(step, -(-num_pieces // self.workers))
+            for start in range(0, num_pieces, step):
+                tiles.append((e1, e2, slice(start, start + step)))
+
+        def fill_tile(tile):
+            e1, e2, rows = tile
+            scores = self.score_strips(strips[e1][rows], strips[e2])
+            if self.rotations:
+                distances[rows, e1, :, e2] = scores
+            else:
+                distances[rows, e1] = scores
+
+        with self.stats.timer("distances"):
+            if self.workers > 1:
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    list(executor.map(fill_tile, tiles))
+            else:
+                for tile in tiles:
+                    fill_tile(tile)
+
+        # The cache is in tile order, so any shuffle can use it
+        if self.distance_cache is not None:
+            self.distance_cache.save(key, distances)
+        self.distances = self.order_distances(distances)
+        return self.distances
+
+    def order_distances(self, distances):
+        """
+        Put distances between tiles (e.g., from the distance cache) into
+        piece order, turning edges by the orientation of each piece.
+        """
+        if distances.ndim == 3:
+            return distances[self.order][:, :, self.order]
+        edges = (np.arange(4) - self.orientation[:, None]) % 4
+        return self.gather_distances(distances, self.order, edges)
+
+    def gather_distances(self, distances, pieces, edges):
+        """
+        Reindex (N, 4, N, 4) distances in one operation, so new piece p and
+        edge e take the distances of piece pieces[p] and edge edges[p, e].
+        """
+        return distances[
+            pieces[:, None, None, None],
+            edges[:, :, None, None],
+            pieces[None, None, :, None],
+            edges[None, None, :, :],
+        ]
+
+    def get_cache_key(self):
+        """
+        Get the key for this puzzle's distances in the distance cache.
+        """
+        return self.distance_cache.get_key(
+            self.image_hash,
+            min_piece_size=self.min_piece_size,
+            max_rgb=self.max_rgb,
+            metric=self.metric.name,
+            rotations=self.rotations,
+        )
+
+    def get_strip_stack(self, e):
+        """
+        Stack the strips of edge e of every piece, shape (N, depth, L[, C]).
+        """
+        if e not in (0, 1, 2, 3):
+            raise ValueError("e should be 0, 1, 2, or 3. Got %s." % e)
+        if self.edges is None:
+            self.extract_edges()
+        if self.orientation.any():
+            return np.stack(self.edges)[(e - self.orientation) % 4, self.order]
+        return self.edges[e][self.order]
+
+    def get_piece_strips(self, p, e):
+        """
+        Get the strips of edge e of a piece, shape (depth, L[, C]).
+        """
+        if e not in (0, 1, 2, 3):
+            raise ValueError("e should be 0, 1, 2, or 3. Got %s." % e)
+        if self.edges is None:
+            self.extract_edges()
+        return self.edges[(e - self.orientation[p]) % 4][self.order[p]]
 
     def get_piece_edges(self, p, e):
         """
@@ -184,16 +648,7 @@ class PhotoPuzzle:
 
         This is where we link data from self.pieces into our calculation
         """
-        piece = self.pieces[p]
-        if e == 0:
-            return piece[0, :]
-        if e == 1:
-            return piece[:, -1]
-        if e == 2:
-            return piece[-1, :][::-1]
-        if e == 3:
-            return piece[:, 0][::-1]
-        raise ValueError("e should be 0, 1, 2, or 3. Got %s." % e)
+        return self.get_piece_strips(p, e)[0]
 
     def edge_matching_score(self, edge1, edge2):
         """
@@ -204,28 +659,38 @@ class PhotoPuzzle:
         edge_diff = edge1 - edge2[::-1]
         return np.log(la.norm(np.minimum(edge_diff, self.max_rgb - edge_diff), ord=1))
 
-    def find_score(self, new_piece, neighbor_piece):
+    def score_strips(self, strips1, strips2):
         """
-        Calculate a score between two pieces
+        Score every pair of edge strips with the puzzle's metric.
+
+        Given strips1 of shape (n1, depth, L[, C]) and strips2 of shape
+        (n2, depth, L[, C]), return an (n1, n2) array of scores.
+        """
+        return self.metric.func(strips1, strips2, self.max_rgb)
+
+    def touching_edges(self, new_loc, neighbor_loc):
+        """
+        Get the edges (new piece edge, neighbor edge) that touch between
+        a piece at new_loc and a neighbor at neighbor_loc.
         """
-        x_diff = new_piece.loc[0] - neighbor_piece.loc[0]
-        y_diff = new_piece.loc[1] - neighbor_piece.loc[1]
+        x_diff = new_loc[0] - neighbor_loc[0]
+        y_diff = new_loc[1] - neighbor_loc[1]
 
         # New piece to the RIGHT of neighbor
         if x_diff == 1 and y_diff == 0:
-            return self.get_piece_distance(new_piece.index, 3, neighbor_piece.index, 1)
+            return 3, 1
 
         # New piece to the LEFT of neighbor
         if x_diff == -1 and y_diff == 0:
-            return self.get_piece_distance(new_piece.index, 1, neighbor_piece.index, 3)
+            return 1, 3
 
         # New piece BELOW neighbor
         if x_diff == 0 and y_diff == 1:
-            return self.get_piece_distance(new_piece.index, 0, neighbor_piece.index, 2)
+            return 0, 2
 
         # New piece ABOVE neighbor
         if x_diff == 0 and y_diff == -1:
-            return self.get_piece_distance(new_piece.index, 2, neighbor_piece.index, 0)
+            return 2, 0
 
         raise ValueError(
             f"Found x_diff={x_diff} and y_diff={y_diff} between "
@@ -233,43 +698,1240 @@ class PhotoPuzzle:
             "be +1 or -1."
         )
 
-    def solve(self):
+    def find_score(self, new_piece, neighbor_piece):
+        """
+        Calculate a score between two pieces
+        """
+        self.stats.find_score_calls += 1
+        new_side, neighbor_side = self.touching_edges(new_piece.loc, neighbor_piece.loc)
+        return self.get_piece_distance(
+            new_piece.index,
+            (new_side - new_piece.rotation) % 4,
+            neighbor_piece.index,
+            (neighbor_side - neighbor_piece.rotation) % 4,
+        )
+
+    def score_board(self, board=None, mean=False):
+        """
+        Get the total score of a board (by default self.board), the sum of
+        distances between the touching edges of every pair of neighbors.
+        Like the score of a placement, lower is better. A board with gaps
+        has fewer pairs to score, so to compare boards of different shapes
+        use mean=True for the mean distance per pair instead.
+        """
+        board = self.board if board is None else board
+        layout = board.layout()
+        turns = board.layout(board.rotation)
+        total = 0.0
+        pairs = 0
+
+        # Pairs of neighbors across (side 1 touches 3) and down (2 touches 0)
+        for side, before, after in (
+            (1, np.s_[:, :-1], np.s_[:, 1:]),
+            (2, np.s_[:-1], np.s_[1:]),
+        ):
+            touching = (layout[before] >= 0) & (layout[after] >= 0)
+            p1 = layout[before][touching]
+            p2 = layout[after][touching]
+            e1 = (side - turns[before][touching]) % 4
+            e2 = (side + 2 - turns[after][touching]) % 4
+            if self.distances is None:
+                scores = [
+                    self.get_piece_distance(*pair) for pair in zip(p1, e1, p2, e2)
+                ]
+            elif self.distances.ndim == 4:
+                scores = self.distances[p1, e1, p2, e2]
+            else:
+                scores = self.distances[p1, e1, p2]
+            total += float(np.sum(scores))
+            pairs += len(p1)
+        if mean:
+            return total / pairs if pairs else 0.0
+        return total
+
+    def get_placed_tiles(self, board=None):
+        """
+        Get the tile and net quarter turns of the piece at each (row,
+        column) of the layout of a board (see Board.layout), with -1 tiles
+        for empty cells. A correct solve shows tile col * rows + row at
+        each cell, with no turns.
+        """
+        board = self.board if board is None else board
+        layout = board.layout()
+        tiles = np.where(layout >= 0, self.order[layout], -1)
+        turns = (self.orientation[layout] + board.layout(board.rotation)) % 4
+        return tiles, turns
+
+    def direct_accuracy(self, board=None):
+        """
+        Get the fraction of pieces placed at their original location and
+        turned the right way up, taking the layout of a board (by default
+        self.board) to start at the original top left corner.
+        """
+        tiles, turns = self.get_placed_tiles(board)
+        rows, cols = np.indices(tiles.shape)
+        correct = (tiles == cols * self.vertical_num_pieces + rows) & (turns == 0)
+        return float(np.count_nonzero(correct) / self.count_pieces())
+
+    def neighbor_accuracy(self, board=None):
+        """
+        Get the fraction of pairs of neighbors in the original image that
+        are neighbors on a board (by default self.board) the same way
+        round. This doesn't mind where on the board pieces are, so a solve
+        that is correct but shifted or turned as a whole still scores 1.
+        """
+        tiles, turns = self.get_placed_tiles(board)
+        num_rows = self.vertical_num_pieces
+        num_cols = self.horizontal_num_pieces
+        correct = 0
+
+        # Pairs of neighbors across (side 1) and down (side 2) the board
+        for side, before, after in (
+            (1, np.s_[:, :-1], np.s_[:, 1:]),
+            (2, np.s_[:-1], np.s_[1:]),
+        ):
+            t1, t2 = tiles[before], tiles[after]
+            n1, n2 = turns[before], turns[after]
+            placed = (t1 >= 0) & (t2 >= 0) & (n1 == n2)
+            t1, t2, n1 = t1[placed], t2[placed], n1[placed]
+
+            # The side of the first tile that faced the second in the image
+            facing = (side - n1) % 4
+            dx = np.array([0, 1, 0, -1])[facing]
+            dy = np.array([-1, 0, 1, 0])[facing]
+            col, row = t1 // num_rows + dx, t1 % num_rows + dy
+            inside = (0 <= col) & (col < num_cols) & (0 <= row) & (row < num_rows)
+            correct += np.count_nonzero(inside & (t2 == col * num_rows + row))
+
+        pairs = num_rows * (num_cols - 1) + num_cols * (num_rows - 1)
+        return float(correct / pairs) if pairs else 1.0
+
+    def score_location(self, loc, exhaustive=False, board=None):
+        """
+        Score every piece against the placed neighbors of an open location.
+
+        This is the vectorized form of one column of make_scores: an array
+        with the mean find_score of each piece index if placed at loc, or
+        with rotations, an (N, 4) array over pieces and their rotations.
+        With a candidate index (see top_k) only the candidates for loc are
+        scored and other pieces get a score of inf, unless exhaustive.
+        Give a board to score a location on it instead of self.board.
+        """
+        board = self.board if board is None else board
+        neighbors = board.neighbors(loc)
+        if self.candidates is None or exhaustive:
+            indices = np.arange(self.count_pieces())
+        else:
+            indices = self.get_location_candidates(loc, board)
+        rotations = np.arange(4 if self.rotations else 1)
+        scores = np.full((self.count_pieces(), len(rotations)), np.inf)
+
+        # Without dense distances, go through the memo one piece at a time
+        if self.distances is None:
+            scores[indices] = [
+                [
+                    np.mean(
+                        [
+                            self.find_score(
+                                new_piece=PlacedPiece(
+                                    index=index, loc=loc, rotation=rotation
+                                ),
+                                neighbor_piece=neighbor_piece,
+                            )
+                            for neighbor_piece in neighbors
+                        ]
+                    )
+                    for rotation in rotations
+                ]
+                for index in indices
+            ]
+
+        elif self.rotations:
+            neighbor_scores = []
+            for neighbor_piece in neighbors:
+                new_side, neighbor_side = self.touching_edges(loc, neighbor_piece.loc)
+
+                # The edge of each rotation of the new piece facing the neighbor
+                new_edges = (new_side - rotations) % 4
+                neighbor_edge = (neighbor_side - neighbor_piece.rotation) % 4
+                neighbor_scores.append(
+                    self.distances[
+                        indices[:, None],
+                        new_edges,
+                        neighbor_piece.index,
+                        neighbor_edge,
+                    ]
+                )
+            scores[indices] = np.mean(neighbor_scores, axis=0)
+
+        else:
+            neighbor_scores = []
+            for neighbor_piece in neighbors:
+                new_edge, _ = self.touching_edges(loc, neighbor_piece.loc)
+                neighbor_scores.append(
+                    self.distances[indices, new_edge, neighbor_piece.index]
+                )
+            scores[indices, 0] = np.mean(neighbor_scores, axis=0)
+
+        # Count dense lookups, which bypass find_score
+        if self.distances is not None:
+            self.stats.dense_lookups += len(indices) * len(neighbors) * len(rotations)
+        return scores if self.rotations else scores[:, 0]
+
+    def get_location_candidates(self, loc, board=None):
+        """
+        Get the sorted candidate pieces for an open location: the union of
+        the top_k matches for the edges of its placed neighbors that face it.
+        """
+        board = self.board if board is None else board
+        candidates = []
+        for neighbor_piece in board.neighbors(loc):
+            _, neighbor_edge = self.touching_edges(loc, neighbor_piece.loc)
+            candidates.append(self.candidates[neighbor_piece.index, neighbor_edge])
+        return np.unique(np.concatenate(candidates))
+
+    def solve(
+        self,
+        strategy="greedy",
+        incremental=True,
+        checkpoint=None,
+        checkpoint_every=100,
+        first=0,
+    ):
         """
         Solve the puzzle (restore to original state, hopefully!
+
+        The strategy selects the placement engine: "greedy" places the best
+        scoring piece and location on each step, and "buddies" places mutual
+        best matches first from a heap of candidates (see iter_buddies).
+        "mst" assembles the whole puzzle at once from the best matches, and
+        then lays it out on the board (see iter_mst). "beam" is greedy over
+        several partial boards at once, with backtracking (see iter_beam).
+
+        For greedy, incremental=True (the default) keeps scores between
+        steps and only rescores the locations touched by the last placement.
+        The placement is identical to rescoring everything on every step
+        (incremental=False), just without the repeated work.
+
+        To be able to resume a long solve, give a checkpoint path to save
+        the solver state to every checkpoint_every placements, and later
+        call resume with the same path.
+
+        The solve grows from piece first, placed at (0, 0). To try several
+        first pieces and keep the best board, see solve_multistart.
+        """
+        for _ in self.iter_solve(
+            strategy=strategy,
+            incremental=incremental,
+            checkpoint=checkpoint,
+            checkpoint_every=checkpoint_every,
+            first=first,
+        ):
+            pass
+
+    def iter_solve(
+        self,
+        strategy="greedy",
+        incremental=True,
+        max_score=None,
+        checkpoint=None,
+        checkpoint_every=100,
+        resume=False,
+        first=0,
+    ):
         """
-        # Reset open and covered places
-        self.open_places = collections.defaultdict(set)
-        self.covered_places = {}
+        Solve the puzzle, yielding each placement as it is made.
+
+        This takes the same arguments as solve, and yields (placed piece,
+        score) tuples, starting with the first piece (with a score of None).
+        Locations are relative to the first piece at (0, 0) until the last
+        piece is placed, when they are shifted like reset_covered_indices.
+        Stop iterating to abort a solve, or set max_score to stop before
+        placing a piece with a higher (worse) score.
+
+        With a checkpoint path the solver state is saved there every
+        checkpoint_every placements (see save_checkpoint). With resume=True
+        the solve continues from the pieces already on the board instead
+        of starting over, as done by resume.
+        """
+        if strategy not in ("greedy", "buddies", "mst", "beam"):
+            raise ValueError(
+                "strategy should be 'greedy', 'buddies', 'mst' or 'beam'. Got %s."
+                % strategy
+            )
+        if strategy not in ("greedy", "beam") and self.rotations:
+            raise ValueError(
+                "rotations are only supported by the greedy and beam strategies. "
+                "Got %s." % strategy
+            )
+        if not 0 <= first < self.count_pieces():
+            raise ValueError(
+                "first should be a piece index below %s. Got %s."
+                % (self.count_pieces(), first)
+            )
+
+        # Reset open and covered places, and stats
+        if not resume:
+            self.reset_board()
+        self.stats.reset()
+        self.piece_distances.reset_stats()
+
+        # Score all edge pairs up front in a few vectorized passes
+        if self.cache_policy == "dense" and self.distances is None:
+            self.compute_distances()
 
-        # Add the first piece.
-        self.add_piece(PlacedPiece(index=0, loc=(0, 0)))
+        # Index the best matches of each edge, for greedy to score only those
+        if strategy in ("greedy", "beam") and self.top_k and self.candidates is None:
+            with self.stats.timer("candidates"):
+                self.candidates = self.get_candidates(self.top_k)
+
+        # Add the first piece, unless the engine lays out its own
+        if not resume and strategy != "mst":
+            first_piece = PlacedPiece(index=first, loc=(0, 0))
+            self.add_piece(first_piece)
+            yield first_piece, None
 
         # Get indices of unused pieces
-        unused_pieces_indices = set(range(len(self.pieces))) - {0}
+        unused_pieces_indices = set(range(self.count_pieces())) - set(
+            self.covered_places.values()
+        )
+
+        self.stats.start()
+        if strategy == "buddies":
+            placements = self.iter_buddies(unused_pieces_indices, max_score)
+        elif strategy == "mst":
+            placements = self.iter_mst(unused_pieces_indices, max_score)
+        elif strategy == "beam":
+            placements = self.iter_beam(unused_pieces_indices, max_score)
+        elif incremental:
+            placements = self.iter_incremental(unused_pieces_indices, max_score)
+        else:
+            placements = self.iter_greedy(unused_pieces_indices, max_score)
+
+        # Only normalize a finished board
+        for count, placement in enumerate(placements, start=1):
+            yield placement
+            if checkpoint and count % checkpoint_every == 0:
+                self.save_checkpoint(
+                    checkpoint, strategy=strategy, incremental=incremental
+                )
+        if len(self.board) == self.count_pieces():
+            self.reset_covered_indices()
+
+    def save_checkpoint(self, path, strategy="greedy", incremental=True):
+        """
+        Save the solver state to a compressed numpy (.npz) file.
+
+        This holds the board, the order of pieces (and the permutation of
+        the last shuffle) and the solve settings, and is written to a
+        temporary name and renamed into place so a checkpoint is never left
+        half written. Distances are not saved: with a cache_dir they are
+        reloaded from the distance cache.
+        """
+        state = self.board.get_state()
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmpfile = tempfile.mkstemp(dir=directory, suffix=".npz")
+        with os.fdopen(fd, "wb") as filey:
+            np.savez_compressed(
+                filey,
+                order=self.order,
+                orientation=self.orientation,
+                permutation=self.permutation,
+                strategy=np.array(strategy),
+                incremental=np.array(incremental),
+                piece_shape=np.array(self.tiles_shape),
+                **state,
+            )
+        os.replace(tmpfile, path)
+        return path
+
+    def load_checkpoint(self, path):
+        """
+        Restore the board and order of pieces from save_checkpoint.
+
+        Returns the solve settings (strategy and incremental) saved with it.
+        """
+        with np.load(path) as data:
+            if tuple(data["piece_shape"]) != self.tiles_shape:
+                raise ValueError(
+                    "Checkpoint %s is for pieces of shape %s, not %s."
+                    % (path, tuple(data["piece_shape"]), self.tiles_shape)
+                )
+            orientation = np.zeros(len(data["order"]), dtype=int)
+            if "orientation" in data:
+                orientation = data["orientation"]
+            self.set_order(data["order"], orientation)
+            self.permutation = np.arange(len(self.order))
+            if "permutation" in data:
+                self.permutation = data["permutation"]
+            self.board = Board.from_state(data)
+            return {
+                "strategy": str(data["strategy"]),
+                "incremental": bool(data["incremental"]),
+            }
+
+    def resume(self, path, checkpoint_every=100):
+        """
+        Resume a solve from a checkpoint, saving new checkpoints to it.
+        """
+        settings = self.load_checkpoint(path)
+        for _ in self.iter_solve(
+            checkpoint=path, checkpoint_every=checkpoint_every, resume=True, **settings
+        ):
+            pass
 
+    def solve_multistart(self, starts=4, strategy="greedy", workers=None):
+        """
+        Solve from several first pieces in parallel, keeping the best board.
+
+        Which piece a solve grows from changes the result, so this solves
+        from piece 0 (like solve, and a random piece after shuffle) and
+        from the starts - 1 most confident other pieces (see get_seeds),
+        across a pool of worker processes (None for one per start, up to
+        the number of cores). Workers share one read-only copy of the dense
+        distances in shared memory. The board with the lowest mean score
+        per pair of neighbors (see score_board) is kept, and the first
+        piece of each start is returned with its score, best first.
+        """
+        if starts < 1:
+            raise ValueError("starts should be at least 1. Got %s." % starts)
+        if self.rotations:
+            raise ValueError("Multi-start solving is not supported with rotations.")
+        if self.cache_policy != "dense":
+            raise ValueError(
+                "Multi-start solving needs cache_policy='dense'. Got %s."
+                % self.cache_policy
+            )
+        if strategy not in ("greedy", "buddies", "beam"):
+            raise ValueError(
+                "strategy should be 'greedy', 'buddies' or 'beam'. Got %s." % strategy
+            )
+        if self.distances is None:
+            self.compute_distances()
+        if strategy in ("greedy", "beam") and self.top_k and self.candidates is None:
+            self.candidates = self.get_candidates(self.top_k)
+        seeds = [0] + [p for p in self.get_seeds(starts) if p != 0][: starts - 1]
+        workers = min(workers or os.cpu_count(), len(seeds))
+
+        results = []
+        if workers == 1:
+            for first in seeds:
+                self.solve(strategy=strategy, first=first)
+                results.append(
+                    (first, self.score_board(mean=True), self.board.get_state())
+                )
+        else:
+            # Workers only need distances (and candidates), so send the
+            # puzzle without the image, tiles and edges, and share distances
+            state = copy.copy(self)
+            state.image = state.tiles = state.edges = None
+            state.distances = None
+            shared, distances = share_array(self.distances)
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=attach_puzzle,
+                    initargs=(state, distances),
+                ) as executor:
+                    futures = [
+                        executor.submit(solve_start, first, strategy) for first in seeds
+                    ]
+                    results = [future.result() for future in futures]
+            finally:
+                shared.close()
+                shared.unlink()
+
+        for first, score, _ in results:
+            logger.info("Solve from piece %s has a total score of %s" % (first, score))
+        results.sort(key=lambda result: result[1])
+        self.board = Board.from_state(results[0][2])
+        return [(first, score) for first, score, _ in results]
+
+    def iter_greedy(self, unused_pieces_indices, max_score=None):
+        """
+        Place the unused pieces, rescoring everything on each step.
+        """
         # Add remaining pieces to the puzzle
+        total = self.count_pieces()
         while unused_pieces_indices:
 
             # Create a matching score based
-            scores = self.make_scores(unused_pieces_indices)
-            new_index, new_loc = min(scores, key=scores.get)
-            unused_pieces_indices.remove(new_index)
-            self.add_piece(PlacedPiece(index=new_index, loc=new_loc))
+            with self.stats.timer("scoring"):
+                scores = self.make_scores(unused_pieces_indices)
+            with self.stats.timer("selection"):
+                best = min(scores, key=scores.get)
+            score = scores[best]
+            if max_score is not None and score > max_score:
+                return
+            new_piece = PlacedPiece(*best)
+            unused_pieces_indices.remove(new_piece.index)
+            with self.stats.timer("placement"):
+                self.add_piece(new_piece)
+            self.stats.placed(total - len(unused_pieces_indices), total)
+            yield new_piece, score
+
+    def iter_incremental(self, unused_pieces_indices, max_score=None):
+        """
+        Place the unused pieces, maintaining scores between placements.
+
+        Each open location keeps its array of scores over all pieces (and
+        rotations) and the best (score, index, rotation) among unused
+        pieces. Placing a piece rescores only the open neighbors of its
+        location, and locations whose best piece was just used pick their
+        next best from the kept scores. Ties resolve like make_scores:
+        lowest piece index, then rotation, then earliest opened location.
+        """
+        unused = np.zeros(self.count_pieces(), dtype=bool)
+        unused[list(unused_pieces_indices)] = True
+
+        # Open location -> scores for all pieces, and the best (score, index,
+        # rotation)
+        location_scores = {}
+        location_best = {}
+
+        def update_best(loc):
+            candidates = np.flatnonzero(unused)
+            scores = location_scores[loc][candidates]
+
+            # Score every piece once the top_k candidates are used up
+            if self.candidates is not None and np.isposinf(scores).all():
+                location_scores[loc] = self.score_location(loc, exhaustive=True)
+                scores = location_scores[loc][candidates]
+
+            # With rotations, the best is over pieces and then rotations
+            best = np.argmin(scores)
+            index, rotation = divmod(best, 4) if scores.ndim == 2 else (best, 0)
+            location_best[loc] = (scores.flat[best], candidates[index], int(rotation))
+
+        # A puzzle of one piece has nothing left to score
+        if not unused.any():
+            return
+
+        with self.stats.timer("scoring"):
+            for loc in self.board.open_locations(sides_first=False):
+                location_scores[loc] = self.score_location(loc)
+                update_best(loc)
+
+        total = self.count_pieces()
+        placed = total - len(unused_pieces_indices)
+        while unused.any():
+
+            # Open locations are few, and iterate in make_scores order
+            with self.stats.timer("selection"):
+                new_loc = min(self.board.open_locations(), key=location_best.get)
+                score, new_index, rotation = location_best[new_loc]
+            if max_score is not None and score > max_score:
+                return
+            unused[new_index] = False
+            new_piece = PlacedPiece(index=new_index, loc=new_loc, rotation=rotation)
+            with self.stats.timer("placement"):
+                self.add_piece(new_piece)
+            location_scores.pop(new_loc)
+            location_best.pop(new_loc)
+
+            # Forget locations that are now outside of the frame
+            if self.frame:
+                for loc in [
+                    loc for loc in location_best if not self.board.is_open(loc)
+                ]:
+                    location_scores.pop(loc)
+                    location_best.pop(loc)
+            placed += 1
+            self.stats.placed(placed, total)
+            yield new_piece, score
+            if not unused.any():
+                break
+
+            with self.stats.timer("scoring"):
+
+                # Rescore locations that gained a neighbor
+                for loc in self.get_neighbors(*new_loc):
+                    if not self.board.is_open(loc):
+                        continue
+                    location_scores[loc] = self.score_location(loc)
+                    update_best(loc)
+
+                # And move on from the piece we just used
+                for loc, (_, index, _) in location_best.items():
+                    if index == new_index:
+                        update_best(loc)
+
+    def get_distance_rows(self, e1, rows):
+        """
+        Get distances from edge e1 of a slice of pieces to every piece.
 
-        self.reset_covered_indices()
+        This reads the dense distances if there are any, and otherwise
+        scores the rows in one batch without keeping them.
+        """
+        if self.distances is not None:
+            return self.distances[rows, e1].copy()
+        return self.score_strips(
+            self.get_strip_stack(e1)[rows], self.get_strip_stack((e1 + 2) % 4)
+        )
+
+    def get_best_matches(self, k, edges=range(4), chunk_size=2**22):
+        """
+        Find the k best matches for edges of every piece.
+
+        Returns (N, len(edges), k) arrays of the pieces whose opposing edge
+        best matches each edge, best first, and of their distances. A piece
+        can't match itself. Distances are read (or scored) in chunks of
+        rows (see get_distance_rows), so this never needs all of them at
+        once.
+        """
+        num_pieces = self.count_pieces()
+        indices = np.arange(num_pieces)
+        matches = np.empty((num_pieces, len(edges), k), dtype=int)
+        weights = np.empty((num_pieces, len(edges), k))
+        if k < 1:
+            return matches, weights
+        step = max(1, chunk_size // num_pieces)
+        for i, e in enumerate(edges):
+            for start in range(0, num_pieces, step):
+                rows = slice(start, start + step)
+                distances = self.get_distance_rows(e, rows)
+
+                # A piece can't match itself, so hide the diagonal
+                distances[np.arange(len(distances)), indices[rows]] = np.inf
+                if k == 1:
+                    best = np.argmin(distances, axis=1)[:, None]
+                else:
+                    best = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(distances, best, axis=1)
+                ranks = np.argsort(scores, axis=1, kind="stable")
+                matches[rows, i] = np.take_along_axis(best, ranks, axis=1)
+                weights[rows, i] = np.take_along_axis(scores, ranks, axis=1)
+        return matches, weights
+
+    def get_candidates(self, k, chunk_size=2**22):
+        """
+        Index the k best matches for each piece edge.
+
+        Returns an (N, 4, k) array where candidates[p, e] are the pieces
+        whose opposing edge best matches edge e of piece p, best first
+        (see get_best_matches).
+        """
+        k = min(k, self.count_pieces() - 1)
+        return self.get_best_matches(k, chunk_size=chunk_size)[0]
+
+    def get_best_buddies(self, chunk_size=2**22):
+        """
+        Find mutual best matches between piece edges.
+
+        Returns an (N, 4) array where buddies[p, e] is the piece whose
+        opposing edge is the best match for edge e of piece p, and whose
+        best match in turn is piece p. Edges without a buddy are -1.
+        """
+        num_pieces = self.count_pieces()
+        indices = np.arange(num_pieces)
+        best = self.get_best_matches(1, chunk_size=chunk_size)[0][:, :, 0]
+
+        buddies = np.full((num_pieces, 4), -1)
+        for e in range(4):
+            mutual = best[best[:, e], (e + 2) % 4] == indices
+            buddies[mutual, e] = best[mutual, e]
+        return buddies
+
+    def get_seeds(self, count):
+        """
+        Get up to count pieces to start solves from, most confident first.
+
+        Like the first piece a person would pick up, a piece is more
+        confident the more of its edges have a best buddy (see
+        get_best_buddies), and then the closer its buddies match.
+        """
+        if self.rotations:
+            raise ValueError("Picking seed pieces is not supported with rotations.")
+        buddies = self.get_best_buddies()
+        pieces, edges = np.nonzero(buddies >= 0)
+        closeness = np.zeros(self.count_pieces())
+        for p, e in zip(pieces, edges):
+            closeness[p] += self.get_piece_distance(p, e, buddies[p, e], (e + 2) % 4)
+        order = np.lexsort((closeness, -(buddies >= 0).sum(axis=1)))
+        return [int(p) for p in order[:count]]
+
+    def get_spanning_forest(self, k=8, chunk_size=2**22):
+        """
+        Assemble pieces into clusters with Kruskal's algorithm.
+
+        The candidate joins are the k best matches to the right of and below
+        each piece, taken from the lowest distance up. A join is made if it
+        links two clusters without putting two pieces in one location, or
+        growing past the width and height of the puzzle, so every cluster
+        is a consistent layout. The smaller cluster is moved onto the larger
+        one, so this takes O(N log N) moves after sorting O(N k) candidates.
+        Returns clusters as dictionaries of location (relative to the
+        cluster) to piece index, largest first.
+        """
+        num_pieces = self.count_pieces()
+        k = min(k, num_pieces - 1)
+
+        # Each piece starts as a cluster of one, with bounds (x0, y0, x1, y1)
+        clusters = {p: {(0, 0): p} for p in range(num_pieces)}
+        bounds = {p: (0, 0, 0, 0) for p in range(num_pieces)}
+        cluster_of = list(range(num_pieces))
+        locations = [(0, 0)] * num_pieces
+        if k < 1:
+            return list(clusters.values())
+
+        # Candidate joins by side, then piece, then rank
+        matches, weights = self.get_best_matches(k, edges=(1, 2), chunk_size=chunk_size)
+        firsts = np.tile(np.repeat(np.arange(num_pieces), k), 2)
+        seconds = matches.transpose(1, 0, 2).ravel()
+        sides = np.repeat([1, 2], num_pieces * k)
+        order = np.argsort(weights.transpose(1, 0, 2).ravel(), kind="stable")
+        joins = zip(
+            firsts[order].tolist(), seconds[order].tolist(), sides[order].tolist()
+        )
+        for p, q, e in joins:
+            a, b = cluster_of[p], cluster_of[q]
+            if a == b:
+                continue
+
+            # Piece q goes to the right of (edge 1) or below (edge 2) piece p
+            x, y = locations[p]
+            target = (x + 1, y) if e == 1 else (x, y + 1)
+            if len(clusters[a]) < len(clusters[b]):
+                mover, keeper = a, b
+                shift = (locations[q][0] - target[0], locations[q][1] - target[1])
+            else:
+                mover, keeper = b, a
+                shift = (target[0] - locations[q][0], target[1] - locations[q][1])
+
+            # The joined cluster can't be bigger than the puzzle
+            x0, y0, x1, y1 = bounds[mover]
+            kx0, ky0, kx1, ky1 = bounds[keeper]
+            merged = (
+                min(kx0, x0 + shift[0]),
+                min(ky0, y0 + shift[1]),
+                max(kx1, x1 + shift[0]),
+                max(ky1, y1 + shift[1]),
+            )
+            if (
+                merged[2] - merged[0] >= self.horizontal_num_pieces
+                or merged[3] - merged[1] >= self.vertical_num_pieces
+            ):
+                continue
+
+            # Or have two pieces in one location
+            moved = {
+                (lx + shift[0], ly + shift[1]): piece
+                for (lx, ly), piece in clusters[mover].items()
+            }
+            if any(loc in clusters[keeper] for loc in moved):
+                continue
+
+            clusters[keeper].update(moved)
+            for loc, piece in moved.items():
+                locations[piece] = loc
+                cluster_of[piece] = keeper
+            bounds[keeper] = merged
+            del clusters[mover], bounds[mover]
+        return sorted(clusters.values(), key=len, reverse=True)
+
+    def iter_mst(self, unused_pieces_indices, max_score=None):
+        """
+        Lay out the largest cluster of get_spanning_forest on the board,
+        and place any pieces left over with the incremental greedy engine.
+
+        The cluster is placed outward from one piece, so every placement
+        but the first is next to a placed piece and scored like greedy.
+        When resuming, the layout is anchored to a cluster piece that is
+        already on the board.
+        """
+        with self.stats.timer("assembly"):
+            cluster = self.get_spanning_forest(self.top_k or 8)[0]
+
+        # Anchor the cluster to a piece already placed, or start at (0, 0)
+        placed = {index: loc for loc, index in self.covered_places.items()}
+        anchors = [loc for loc, index in cluster.items() if index in placed]
+        if anchors:
+            start = anchors[0]
+            anchor = placed[cluster[start]]
+            offset = (anchor[0] - start[0], anchor[1] - start[1])
+
+        # A board of other pieces can't take the cluster as laid out
+        elif placed:
+            cluster = {}
+        else:
+            start = min(cluster)
+            offset = (-start[0], -start[1])
+
+        # Breadth first from the anchor, through neighboring locations
+        total = self.count_pieces()
+        queue = collections.deque([start] if cluster else [])
+        seen = set(queue)
+        while queue:
+            x, y = queue.popleft()
+            for loc in ((x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y)):
+                if loc in cluster and loc not in seen:
+                    seen.add(loc)
+                    queue.append(loc)
+
+            index = cluster[x, y]
+            loc = (x + offset[0], y + offset[1])
+            if index not in unused_pieces_indices or self.board.is_covered(loc):
+                continue
+            new_piece = PlacedPiece(index=index, loc=loc)
+            neighbors = self.board.neighbors(loc)
+            score = None
+            if neighbors:
+                score = np.mean(
+                    [self.find_score(new_piece, neighbor) for neighbor in neighbors]
+                )
+            if max_score is not None and score is not None and score > max_score:
+                return
+            unused_pieces_indices.remove(index)
+            with self.stats.timer("placement"):
+                self.add_piece(new_piece)
+            self.stats.placed(total - len(unused_pieces_indices), total)
+            yield new_piece, score
+
+        # Pieces that didn't join the cluster are placed greedily
+        if unused_pieces_indices:
+            yield from self.iter_incremental(unused_pieces_indices, max_score)
+
+    def iter_beam(self, unused_pieces_indices, max_score=None):
+        """
+        Place the unused pieces with a beam search over partial boards.
+
+        Each step extends every board in the beam with its beam_width best
+        placements (as greedy would score them), and keeps the greedy child
+        (the best placement on the first board, so the first board of every
+        beam is the greedy solve) and the beam_width - 1 other distinct
+        boards with the lowest total distance between pairs of neighbors.
+        Boards are chains of placements (see Placement), and like the
+        incremental greedy engine each keeps the best moves of its open
+        locations between steps (see BeamState), so a step only rescores
+        around the new placement and where a location runs out of moves.
+
+        This trades memory for time: each board in the beam has its own
+        grids (see Board), so memory grows with beam_width times the size
+        of the board, about 150 bytes per piece. To limit it, a board is
+        handed down to its last kept child and copied only for others, the
+        states of at most the last two beams are kept, and states keep the
+        few best moves of each location instead of its scores for every
+        piece, which would take about 8 bytes per piece per location.
+
+        When backtrack_score is set and the best placement of a step scores
+        above it, the search goes back a step and searches it again twice
+        as wide. Each step is widened at most once, so the search costs at
+        most about three times as much as without backtracking. The states
+        of the last two beams are kept to go back to, and those of earlier
+        beams are rebuilt if the search goes back further.
+
+        Of the boards in the last beam, the one with the most pairs of
+        neighbors, and then the lowest score_board, is placed on self.board
+        one piece at a time. Greedy's board is among them, so a wider beam
+        never ends up with a worse board than greedy.
+        """
+        placed = [self.board.piece(loc) for loc in self.covered_places]
+        start = Placement.start(placed)
+        beams = [[start]]
+        states = [[self.get_beam_state(start)]]
+        kept = 1 if self.backtrack_score is None else 2
+        widened = set()
+        remaining = len(unused_pieces_indices)
+        while len(beams) <= remaining:
+            step = len(beams)
+            width = self.beam_width * (2 if step in widened else 1)
+            with self.stats.timer("search"):
+                if states[-1] is None:
+                    states[-1] = [self.get_beam_state(chain) for chain in beams[-1]]
+                children, parents = self.expand_beam(beams[-1], states[-1], width)
+            if not children:
+                break
+
+            # Search the last step again if the next placement is unlikely
+            if (
+                self.backtrack_score is not None
+                and min(child.score for child in children) > self.backtrack_score
+                and step > 1
+                and step - 1 not in widened
+            ):
+                widened.add(step - 1)
+                beams.pop()
+                states.pop()
+                continue
+            with self.stats.timer("search"):
+                child_states = self.advance_beam(children, parents, states[-1])
+            beams.append(children)
+            states.append(child_states)
+            if len(states) > kept:
+                states[-kept - 1] = None
+
+        # A board with pieces sticking out has fewer pairs of neighbors to
+        # score, so keep the board with the most pairs and lowest total
+        boards = [state.board for state in states[-1]]
+        best = min(
+            range(len(boards)),
+            key=lambda i: (-boards[i].count_pairs(), self.score_board(boards[i])),
+        )
+
+        # Place the best board, in the order its pieces were placed
+        total = self.count_pieces()
+        for placement in beams[-1][best].placements(since=len(placed)):
+            if max_score is not None and placement.score > max_score:
+                return
+            unused_pieces_indices.remove(placement.piece.index)
+            with self.stats.timer("placement"):
+                self.add_piece(placement.piece)
+            self.stats.placed(total - len(unused_pieces_indices), total)
+            yield placement.piece, placement.score
+
+    def expand_beam(self, beam, states, width):
+        """
+        Extend each board of a beam by its width best placements, and
+        return the greedy child and the width - 1 best other distinct
+        boards, by total distance between neighbors, with the index of the
+        board each extends.
+
+        Placements on a board are ordered like the incremental greedy
+        engine (score, piece index, rotation, then the earliest opened
+        location), so the first placement on the first board is the one
+        greedy makes, and a beam_width of one places pieces like greedy.
+        """
+        children = {}
+        greedy = None
+        for parent, (placement, state) in enumerate(zip(beam, states)):
+            for score, piece in self.get_beam_moves(state, width):
+                pairs = len(state.board.neighbors(piece.loc))
+                child = placement.extend(piece, score, pairs)
+                if greedy is None:
+                    greedy = (child, parent)
+                if (
+                    child.key not in children
+                    or child.total < children[child.key][0].total
+                ):
+                    children[child.key] = (child, parent)
+        if greedy is None:
+            return [], []
+        children.pop(greedy[0].key)
+        others = sorted(children.values(), key=lambda child: child[0].total)
+        best = [greedy] + others[: width - 1]
+        return [child for child, _ in best], [parent for _, parent in best]
+
+    def advance_beam(self, children, parents, states):
+        """
+        Get the search states of the children of a beam from the states of
+        the boards they extend (see expand_beam).
+
+        The last child of a board takes its state over, unless the search
+        can come back to it, and other children place on a copy.
+        """
+        shared = collections.Counter(parents)
+        child_states = []
+        for child, parent in zip(children, parents):
+            shared[parent] -= 1
+            state = states[parent]
+            if shared[parent] or self.backtrack_score is not None:
+                state = BeamState(
+                    board=state.board.copy(),
+                    unused=state.unused.copy(),
+                    moves=dict(state.moves),
+                    pieces=dict(state.pieces),
+                )
+            child_states.append(self.advance_beam_state(state, child.piece))
+        return child_states
+
+    def get_beam_state(self, placement):
+        """
+        Make the search state of a chain of placements from scratch.
+        """
+        board = placement.to_board(
+            self.horizontal_num_pieces,
+            self.vertical_num_pieces,
+            frame=self.frame,
+            rotations=self.rotations,
+        )
+        unused = np.ones(self.count_pieces(), dtype=bool)
+        unused[board.grid[board.grid >= 0]] = False
+        state = BeamState(board=board, unused=unused, moves={}, pieces={})
+        for loc in board.open_locations(sides_first=False):
+            self.update_beam_moves(state, loc)
+        return state
+
+    def advance_beam_state(self, state, piece):
+        """
+        Place a piece on the board of a search state, and rescore like
+        iter_incremental: the open neighbors of its location are rescored,
+        and the piece is dropped from the best moves of other locations.
+        A location is rescored to find more moves when it runs out of them
+        (or when get_beam_moves needs more), so states don't share the cost
+        of keeping more moves than a step takes.
+        """
+        board = state.board
+        board.place(piece.index, piece.loc, piece.rotation)
+        state.unused[piece.index] = False
+        state.moves.pop(piece.loc)
+        state.pieces.pop(piece.loc)
+
+        # Forget locations that are now outside of the frame
+        if self.frame:
+            for loc in [loc for loc in state.moves if not board.is_open(loc)]:
+                state.moves.pop(loc)
+                state.pieces.pop(loc)
+
+        for loc in self.get_neighbors(*piece.loc):
+            if board.is_open(loc):
+                self.update_beam_moves(state, loc)
+        for loc in [
+            loc for loc, pieces in state.pieces.items() if piece.index in pieces
+        ]:
+            moves, complete, opened = state.moves[loc]
+            moves = [move for move in moves if move[1] != piece.index]
+            if not moves:
+                self.update_beam_moves(state, loc)
+                continue
+
+            # Moves are shared between states, so replace them
+            state.moves[loc] = (moves, complete, opened)
+            state.pieces[loc] = state.pieces[loc] - {piece.index}
+        return state
+
+    def update_beam_moves(self, state, loc):
+        """
+        Find the best (score, index, rotation) moves at an open location of
+        a search state among its unused pieces, as many as the widest step
+        could take, in order.
+        """
+        candidates = np.flatnonzero(state.unused)
+        scores = self.score_location(loc, board=state.board)[candidates]
+
+        # Score every piece once the top_k candidates are used up
+        if self.candidates is not None and np.isposinf(scores).all():
+            scores = self.score_location(loc, exhaustive=True, board=state.board)
+            scores = scores[candidates]
+
+        # The best moves, with all ties at the last one to order
+        scores = scores.reshape(len(candidates), 4 if self.rotations else 1)
+        k = min(
+            self.beam_width * (1 if self.backtrack_score is None else 2), scores.size
+        )
+        moves = []
+        if k:
+            cutoff = np.partition(scores, k - 1, axis=None)[k - 1]
+            index, rotation = np.nonzero((scores <= cutoff) & (scores < np.inf))
+            for i in np.lexsort((rotation, index, scores[index, rotation]))[:k]:
+                moves.append(
+                    (
+                        float(scores[index[i], rotation[i]]),
+                        int(candidates[index[i]]),
+                        int(rotation[i]),
+                    )
+                )
+        opened = int(state.board.opened[state.board.cell(loc)])
+        state.moves[loc] = (moves, len(moves) < k, opened)
+        state.pieces[loc] = {index for _, index, _ in moves}
+
+    def get_beam_moves(self, state, width):
+        """
+        Get the width best (score, placed piece) moves on the board of a
+        search state, ordered like expand_beam.
+        """
+        # Open locations are those with moves, unless the frame puts sides first
+        locations = state.moves
+        if any(state.board.pinned):
+            locations = state.board.open_locations()
+
+        # The best moves are at the locations with the best first moves
+        locations = heapq.nsmallest(
+            width,
+            (
+                (state.moves[loc][0][0], state.moves[loc][2], loc)
+                for loc in locations
+                if state.moves[loc][0]
+            ),
+        )
+
+        # Which may need more moves than they have left
+        for _, _, loc in locations:
+            moves, complete, _ = state.moves[loc]
+            if len(moves) < width and not complete:
+                self.update_beam_moves(state, loc)
+
+        moves = heapq.nsmallest(
+            width,
+            (
+                (score, index, rotation, opened, loc)
+                for _, opened, loc in locations
+                for score, index, rotation in state.moves[loc][0][:width]
+            ),
+        )
+        return [
+            (score, PlacedPiece(index=index, loc=loc, rotation=rotation))
+            for score, index, rotation, _, loc in moves
+        ]
+
+    def iter_buddies(self, unused_pieces_indices, max_score=None):
+        """
+        Place the unused pieces from a heap of best buddy candidates.
+
+        Each open location pushes its best unused piece, and the piece its
+        placed neighbors agree is their best buddy, as (sides, priority,
+        score, piece, location, version) entries. Buddy placements have
+        priority over plain best matches, so confident placements are made
+        first, after corners and sides of a frame (see Board.priority).
+        Entries go stale instead of being removed: when their location has
+        since gained a neighbor (version) or been covered they are dropped,
+        and when their piece has been used the location pushes its next
+        best piece. Each selection is then O(log n) in the heap size.
+        """
+        with self.stats.timer("buddies"):
+            buddies = self.get_best_buddies()
+        unused = np.zeros(self.count_pieces(), dtype=bool)
+        unused[list(unused_pieces_indices)] = True
+
+        location_scores = {}
+        versions = collections.Counter()
+        sides = {}
+        heap = []
+
+        def push_best(loc):
+            candidates = np.flatnonzero(unused)
+            best = candidates[np.argmin(location_scores[loc][candidates])]
+            heapq.heappush(
+                heap,
+                (sides[loc], 1, location_scores[loc][best], best, loc, versions[loc]),
+            )
+
+        def push_location(loc):
+            versions[loc] += 1
+            sides[loc] = -self.board.priority(loc)
+            location_scores[loc] = self.score_location(loc)
+            push_best(loc)
+
+            # The piece named by placed neighbors as their best buddy
+            suggested = set()
+            for neighbor_piece in self.board.neighbors(loc):
+                _, neighbor_edge = self.touching_edges(loc, neighbor_piece.loc)
+                suggested.add(buddies[neighbor_piece.index, neighbor_edge])
+            suggested.discard(-1)
+            if len(suggested) == 1:
+                buddy = suggested.pop()
+                if unused[buddy]:
+                    heapq.heappush(
+                        heap,
+                        (
+                            sides[loc],
+                            0,
+                            location_scores[loc][buddy],
+                            buddy,
+                            loc,
+                            versions[loc],
+                        ),
+                    )
+
+        # A puzzle of one piece has nothing left to score
+        if not unused.any():
+            return
+
+        with self.stats.timer("scoring"):
+            for loc in self.board.open_locations(sides_first=False):
+                push_location(loc)
+        pinned = self.board.pinned
+
+        total = self.count_pieces()
+        placed = total - len(unused_pieces_indices)
+        while unused.any():
+            with self.stats.timer("selection"):
+                _, _, score, new_index, new_loc, version = heapq.heappop(heap)
+            if not self.board.is_open(new_loc) or version != versions[new_loc]:
+                continue
+            if not unused[new_index]:
+                with self.stats.timer("scoring"):
+                    push_best(new_loc)
+                continue
+            if max_score is not None and score > max_score:
+                return
+
+            unused[new_index] = False
+            new_piece = PlacedPiece(index=new_index, loc=new_loc)
+            with self.stats.timer("placement"):
+                self.add_piece(new_piece)
+            location_scores.pop(new_loc)
+            placed += 1
+            self.stats.placed(placed, total)
+            yield new_piece, score
+            if not unused.any():
+                break
+
+            with self.stats.timer("scoring"):
+                for loc in self.get_neighbors(*new_loc):
+                    if self.board.is_open(loc):
+                        push_location(loc)
+
+                # Once a side of the frame is known, corners and sides go first
+                if self.board.pinned != pinned:
+                    pinned = self.board.pinned
+                    for loc in self.board.open_locations(sides_first=False):
+                        push_location(loc)
 
     def reset_covered_indices(self):
-        x_min = min([loc[0] for loc in self.covered_places])
-        y_min = min([loc[1] for loc in self.covered_places])
-        self.covered_places = {
-            (x - x_min, y - y_min): index
-            for (x, y), index in self.covered_places.items()
-        }
+        """
+        Shift covered places so the solved puzzle starts at (0, 0).
+        """
+        self.board.normalize()
+
+    def render(self, layout, grid_lines=False, labels=False, rotations=None):
+        """
+        Render a layout of piece indices (-1 for none) into one image array.
+
+        Pieces are turned by their orientation, and then by rotations (the
+        quarter turns at each cell of the layout) if given. Optionally draw
+        grid lines between pieces, and label each piece with its index.
+        """
+        self.load_pieces()
+        turns = self.orientation[np.maximum(layout, 0)]
+        if rotations is not None:
+            turns = turns + rotations
+        canvas = render_layout(
+            self.tiles, self.order, layout, turns if turns.any() else None
+        )
+        if grid_lines:
+            draw_grid_lines(canvas, self.piece_height, self.piece_width)
+        if labels:
+            draw_labels(canvas, layout, self.piece_height, self.piece_width)
+        return canvas
+
+    def render_puzzle(self, grid_lines=False, labels=False):
+        """
+        Render the pieces in their current order, like get_puzzle_figure.
+        """
+        layout = np.arange(self.count_pieces()).reshape(
+            self.horizontal_num_pieces, self.vertical_num_pieces
+        )
+        return self.render(layout.T, grid_lines=grid_lines, labels=labels)
+
+    def render_solution(self, grid_lines=False, labels=False):
+        """
+        Render the solved (or partly solved) board, like get_solved_figure,
+        without a matplotlib subplot per piece.
+        """
+        return self.render(
+            self.board.layout(),
+            grid_lines=grid_lines,
+            labels=labels,
+            rotations=self.board.layout(self.board.rotation),
+        )
+
+    def save_solution(self, filename, grid_lines=False, labels=False):
+        """
+        Render the solved board and save it as one image (or .npy array).
+        """
+        canvas = self.render_solution(grid_lines=grid_lines, labels=labels)
+        if filename.endswith(".npy"):
+            np.save(filename, canvas)
+        else:
+            write_image(filename, canvas, cmap=self.cmap)
+        return filename
 
     def plot_puzzle(self, n_rows, n_cols, plot_piece):
         """
         Shared function to plot puzzle
         """
+        import matplotlib.pyplot as plt
+
         fig, axs = plt.subplots(n_rows, n_cols)
         fig.set_figheight(n_rows)
         fig.set_figwidth(n_cols)
@@ -294,11 +1956,12 @@ class PhotoPuzzle:
         """
         Show the current state of the puzzle.
 
-        This function plots self.pieces, not the puzzle solution.
+        This function plots self.pieces, not the puzzle solution. It makes
+        one subplot per piece, so for large puzzles see render_puzzle.
         """
 
         def plot_piece(ax, x, y):
-            ax.imshow(self.pieces[y + x * self.vertical_num_pieces])
+            ax.imshow(self.get_piece(y + x * self.vertical_num_pieces))
 
         return self.plot_puzzle(
             self.vertical_num_pieces, self.horizontal_num_pieces, plot_piece
@@ -307,22 +1970,36 @@ class PhotoPuzzle:
     def get_solved_figure(self):
         """
         Get figure for solved puzzle
+
+        This makes one subplot per piece, which is useful for debugging but
+        slow for large puzzles. See render_solution and save_solution.
         """
-        n_rows = max([loc[1] for loc in self.covered_places]) + 1
-        n_cols = max([loc[0] for loc in self.covered_places]) + 1
+        covered_places = self.covered_places
 
         # The solved figure has a different function to plot the piece
         def plot_covered_piece(ax, x, y):
-            if (x, y) in self.covered_places:
-                piece_index = self.covered_places[(x, y)]
-                ax.imshow(self.pieces[piece_index])
+            if (x, y) in covered_places:
+                piece = self.board.piece((x, y))
+                ax.imshow(self.get_piece(piece.index, piece.rotation))
 
         return self.plot_puzzle(
-            n_rows=max([loc[1] for loc in self.covered_places]) + 1,
-            n_cols=max([loc[0] for loc in self.covered_places]) + 1,
+            n_rows=max([loc[1] for loc in covered_places]) + 1,
+            n_cols=max([loc[0] for loc in covered_places]) + 1,
             plot_piece=plot_covered_piece,
         )
 
+    @property
+    def tiles_shape(self):
+        """
+        The number of pieces across, down, and the height and width of each.
+        """
+        return (
+            self.horizontal_num_pieces,
+            self.vertical_num_pieces,
+            self.piece_height,
+            self.piece_width,
+        )
+
     @property
     def vertical_num_pieces(self):
         return self.height // self.min_piece_size
@@ -349,7 +2026,7 @@ class PhotoPuzzle:
 
     def count_pieces(self):
         """return a count of the pieces"""
-        return len(self.pieces)
+        return len(self.order)
 
     def __repr__(self):
         return self.__str__()
@@ -0,0 +1,62 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# The puzzle of a worker process, and the shared memory holding its
+# distances, see attach_puzzle
+puzzle = None
+memory = None
+
+
+def share_array(array):
+    """
+    Copy an array into a new block of shared memory.
+
+    Returns the shared memory, which the caller should close and unlink
+    when done, and the (name, shape, dtype) to attach to it with.
+    """
+    shared = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shared.buf)[...] = array
+    return shared, (shared.name, array.shape, array.dtype.str)
+
+
+def attach_array(name, shape, dtype):
+    """
+    Attach to an array in shared memory, read only.
+
+    Returns the shared memory, which needs to be kept open while the
+    array is used, and the array.
+    """
+    shared = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shared.buf)
+    array.flags.writeable = False
+    return shared, array
+
+
+def attach_puzzle(state, distances):
+    """
+    Set up a worker process with a puzzle and its shared distances.
+
+    The puzzle is given without distances, so they are not copied to
+    every worker, and distances are the (name, shape, dtype) of the
+    shared array from share_array.
+    """
+    global puzzle, memory
+    memory, array = attach_array(*distances)
+    puzzle = state
+    puzzle.distances = array
+
+
+def solve_start(first, strategy="greedy"):
+    """
+    Solve the worker's puzzle starting from piece first.
+
+    Returns the piece, the mean score of the solved board (see
+    PhotoPuzzle.score_board) and the board state (see Board.get_state).
+    """
+    puzzle.solve(strategy=strategy, first=first)
+    return first, puzzle.score_board(mean=True), puzzle.board.get_state()
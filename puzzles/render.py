@@ -0,0 +1,109 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+import numpy as np
+
+# A 3x5 pixel font for drawing piece labels into an image
+digits = {
+    "0": ("111", "101", "101", "101", "111"),
+    "1": ("010", "110", "010", "010", "111"),
+    "2": ("111", "001", "111", "100", "111"),
+    "3": ("111", "001", "111", "001", "111"),
+    "4": ("101", "101", "111", "001", "001"),
+    "5": ("111", "100", "111", "001", "111"),
+    "6": ("111", "100", "111", "101", "111"),
+    "7": ("111", "001", "001", "001", "001"),
+    "8": ("111", "101", "111", "101", "111"),
+    "9": ("111", "101", "111", "001", "111"),
+}
+glyphs = {
+    digit: np.array([[c == "1" for c in row] for row in rows])
+    for digit, rows in digits.items()
+}
+
+
+def get_max_value(image):
+    """
+    Get the brightest value for an image dtype (e.g., 255 or 1.0).
+    """
+    if np.issubdtype(image.dtype, np.integer):
+        return np.iinfo(image.dtype).max
+    return 1.0
+
+
+def render_layout(tiles, order, layout, rotations=None):
+    """
+    Assemble pieces into one image.
+
+    tiles is the (horizontal, vertical, height, width[, color]) view of
+    pieces, order maps piece index to tile, and layout is a 2-D array with
+    the piece index at each (row, column) of the board, or -1 for none.
+    All pieces are gathered in one indexing operation, and empty cells
+    are left black. For square pieces, rotations can give the clockwise
+    quarter turns of the tile at each cell of the layout.
+    """
+    vertical = tiles.shape[1]
+    tile = order[np.maximum(layout, 0)]
+    pieces = tiles[tile // vertical, tile % vertical]
+    pieces[layout < 0] = 0
+    if rotations is not None:
+        rotate_pieces(pieces, rotations)
+
+    # (rows, cols, height, width, ...) -> (rows * height, cols * width, ...)
+    rows, cols, height, width = pieces.shape[:4]
+    return pieces.swapaxes(1, 2).reshape(
+        (rows * height, cols * width) + pieces.shape[4:]
+    )
+
+
+def rotate_pieces(pieces, rotations):
+    """
+    Turn square pieces in place by a number of clockwise quarter turns each.
+
+    pieces has shape (..., height, width[, color]) and rotations has the
+    shape of the leading axes, so pieces are turned in one operation per
+    number of turns.
+    """
+    rotations = np.asarray(rotations) % 4
+    for turns in (1, 2, 3):
+        turned = rotations == turns
+        pieces[turned] = np.rot90(pieces[turned], -turns, axes=(1, 2))
+    return pieces
+
+
+def draw_grid_lines(canvas, height, width, value=None):
+    """
+    Draw one pixel lines between pieces of a given height and width.
+    """
+    value = get_max_value(canvas) if value is None else value
+    canvas[::height] = value
+    canvas[:, ::width] = value
+    return canvas
+
+
+def draw_label(canvas, text, row, col, scale=1, value=None):
+    """
+    Draw digits into the canvas with their top left corner at (row, col),
+    on a black box so they can be read on any piece.
+    """
+    value = get_max_value(canvas) if value is None else value
+    box = canvas[row : row + 7 * scale, col : col + (4 * len(text) + 1) * scale]
+    box[...] = 0
+    for i, digit in enumerate(text):
+        glyph = np.kron(glyphs[digit], np.ones((scale, scale), dtype=bool))
+        top, left = row + scale, col + (4 * i + 1) * scale
+        region = canvas[top : top + glyph.shape[0], left : left + glyph.shape[1]]
+        region[glyph[: region.shape[0], : region.shape[1]]] = value
+    return canvas
+
+
+def draw_labels(canvas, layout, height, width):
+    """
+    Label each piece in a layout with its index.
+    """
+    scale = max(1, min(height, width) // 24)
+    for (row, col), index in np.ndenumerate(layout):
+        if index >= 0:
+            draw_label(canvas, str(index), row * height, col * width, scale=scale)
+    return canvas
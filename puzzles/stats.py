@@ -0,0 +1,132 @@
+__author__ = "Vanessa Sochat"
+__copyright__ = "Copyright 2017-2021, Vanessa Sochat"
+__license__ = "MPL 2.0"
+
+from puzzles.logger import logger
+
+import collections
+import contextlib
+import time
+
+import numpy as np
+
+
+class PhaseTimer:
+    """
+    Add the time spent inside a with block to a phase of SolveStats.
+    """
+
+    __slots__ = ("stats", "name", "start")
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.stats.phases[self.name] += time.perf_counter() - self.start
+        self.stats.phase_calls[self.name] += 1
+
+
+class SolveStats:
+    def __init__(self, enabled=False, progress_every=None):
+        """
+        Instrumentation for a solve.
+
+        When enabled, this records the time spent in each phase (edges,
+        distances, scoring, selection and placement), how many times each
+        phase was entered, and the latency of each placement. Calls to
+        find_score are counted, and so are distances read from the dense
+        array in vectorized batches (dense_lookups), which bypass it.
+        Independently, progress_every streams progress through the logger
+        every so many placements. When disabled, timers are a shared no-op context.
+        """
+        self.enabled = enabled
+        self.progress_every = progress_every
+        self.reset()
+
+    def reset(self):
+        self.phases = collections.defaultdict(float)
+        self.phase_calls = collections.Counter()
+        self.find_score_calls = 0
+        self.dense_lookups = 0
+        self.latencies = []
+        self.last_placement = None
+
+    def timer(self, name):
+        """
+        Time a phase, for use as a context manager.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        return PhaseTimer(self, name)
+
+    def start(self):
+        """
+        Mark the start of placements, to measure the first latency from.
+        """
+        self.last_placement = time.perf_counter()
+
+    def placed(self, done, total):
+        """
+        Record that a placement was made, done out of total.
+        """
+        if self.enabled:
+            now = time.perf_counter()
+            self.latencies.append(now - self.last_placement)
+            self.last_placement = now
+        if self.progress_every and (done % self.progress_every == 0 or done == total):
+            logger.progress(done=done, total=total)
+
+    def as_dict(self, cache=None):
+        """
+        Get the stats as a dictionary, optionally with cache statistics.
+        """
+        stats = {
+            "phases": dict(self.phases),
+            "phase_calls": dict(self.phase_calls),
+            "find_score_calls": self.find_score_calls,
+            "dense_lookups": self.dense_lookups,
+            "placements": len(self.latencies),
+        }
+        if self.latencies:
+            latencies = np.array(self.latencies)
+            stats["latency"] = {
+                "mean": float(latencies.mean()),
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max()),
+            }
+        if cache is not None:
+            stats["cache"] = cache
+        return stats
+
+    def log(self, cache=None):
+        """
+        Write a summary of the stats to the logger.
+        """
+        stats = self.as_dict(cache)
+        for name, seconds in sorted(stats["phases"].items(), key=lambda x: -x[1]):
+            logger.info(
+                "%-18s: %.4fs (%s calls)" % (name, seconds, stats["phase_calls"][name])
+            )
+        logger.info("%-18s: %s" % ("find_score calls", stats["find_score_calls"]))
+        logger.info("%-18s: %s" % ("dense lookups", stats["dense_lookups"]))
+        if "latency" in stats:
+            logger.info(
+                "%-18s: mean %.6fs, p95 %.6fs, max %.6fs"
+                % (
+                    "placement latency",
+                    stats["latency"]["mean"],
+                    stats["latency"]["p95"],
+                    stats["latency"]["max"],
+                )
+            )
+        if cache is not None:
+            logger.info(
+                "%-18s: %s hits, %s misses, %s evictions"
+                % ("distance cache", cache["hits"], cache["misses"], cache["evictions"])
+            )
@@ -110,6 +110,28 @@ def read_json(filename, mode="r"):
     return data
 
 
+def read_image(filename):
+    """
+    Read an image file into an array.
+
+    matplotlib is only imported here (and in write_image), so that solving
+    puzzles doesn't pay for importing it.
+    """
+    import matplotlib.image as mpimg
+
+    return mpimg.imread(filename)
+
+
+def write_image(filename, image, **kwargs):
+    """
+    Write an image array to file, with kwargs passed to imsave.
+    """
+    import matplotlib.image as mpimg
+
+    mpimg.imsave(filename, image, **kwargs)
+    return filename
+
+
 def recursive_find(base, pattern=None):
     """
     Recursively find files below a base.
@@ -78,6 +78,7 @@ if __name__ == "__main__":
         long_description_content_type="text/markdown",
         keywords=KEYWORDS,
         install_requires=INSTALL_REQUIRES,
+        entry_points={"console_scripts": ["puzzles-batch=puzzles.batch:main"]},
         classifiers=[
             "Intended Audience :: Science/Research",
             "Intended Audience :: Developers",
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from puzzles.models import PhotoPuzzle
+
+
+@pytest.fixture
+def one_piece(tmp_path):
+    """
+    An image no bigger than min_piece_size, so a puzzle of one piece.
+    """
+    image = np.random.RandomState(0).randint(0, 255, (20, 20, 3)).astype(np.uint8)
+    path = str(tmp_path / "one.npy")
+    np.save(path, image)
+    return path
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+def test_one_piece_greedy(one_piece, incremental):
+    puzzle = PhotoPuzzle(one_piece, min_piece_size=20)
+    puzzle.solve(incremental=incremental)
+    assert puzzle.covered_places == {(0, 0): 0}
+
+
+def test_one_piece_buddies(one_piece):
+    puzzle = PhotoPuzzle(one_piece, min_piece_size=20)
+    puzzle.solve(strategy="buddies")
+    assert puzzle.covered_places == {(0, 0): 0}
+
+
+@pytest.mark.parametrize("strategy", ["greedy", "buddies"])
+def test_one_piece_multistart(one_piece, strategy):
+    puzzle = PhotoPuzzle(one_piece, min_piece_size=20)
+    assert puzzle.solve_multistart(starts=2, strategy=strategy, workers=1) == [(0, 0.0)]
+    assert puzzle.covered_places == {(0, 0): 0}
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_incremental_rotations_ties(tmp_path, seed):
+    """
+    Flat regions tie many placements, which both greedy modes should break
+    the same way.
+    """
+    image = np.zeros((96, 96, 3), dtype=np.uint8)
+    image[:, 48:] = 200
+    image[60:, :30] = 90
+    path = str(tmp_path / "flat.npy")
+    np.save(path, image)
+
+    placements = []
+    for incremental in (True, False):
+        np.random.seed(seed)
+        puzzle = PhotoPuzzle(path, min_piece_size=16, rotations=True)
+        puzzle.shuffle()
+        placements.append(
+            [piece for piece, _ in puzzle.iter_solve(incremental=incremental)]
+        )
+    assert placements[0] == placements[1]